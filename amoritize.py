@@ -1,17 +1,139 @@
+# Attempts per case before giving up on one that never reaches its breakpoint
+MAX_ATTEMPTS = 200
+# Grid of the cached table (percentages): starting chance, change per failed attempt, breakpoint
+TABLE_PERCENTS = range(0, 101)
+TABLE_INCREMENTS = range(-10, 11)
+TABLE_BREAKPOINTS = range(0, 101, 10)
+
+
 def amoritizedActions(percent, incr, brkpoint=100, compr=lambda a, b: a >= b):
+    # Retry until success, the chance moving by incr after every failure, until compr(chance, brkpoint) says stop
+    # Another attempt only happens if every attempt so far failed, so its cost is the running product
     cost = 0
     overall_fail_probability = 1
     while True:
-        added_cost = max(1-percent/100, 0)
-        overall_fail_probability *= added_cost
-        print(f'Costs {added_cost}')
-        cost += added_cost
+        overall_fail_probability *= min(max(1-percent/100, 0), 1)
+        cost += overall_fail_probability
         if compr(percent, brkpoint):
             break
         percent += incr
     return 1 + cost, 1-overall_fail_probability
 
-# print(amoritizedActions(50, -10, 20, lambda a, b: a <= b))
-# print(amoritizedActions(50, 5))
-print(amoritizedActions(83, 5))
-print(amoritizedActions(100, 0))
+
+def amoritizedActionsCase(percent, incr=0, brkpoint=100, max_attempts=MAX_ATTEMPTS):
+    # amoritizedActionsGrid for a single case in plain floats, step for step the same arithmetic
+    rising = incr >= 0
+    chance = float(percent)
+    cost = 0.0
+    overall_fail = 1.0
+    for _ in range(max_attempts):
+        overall_fail = overall_fail * min(max(1 - chance / 100, 0), 1)
+        cost += overall_fail
+        if (chance >= brkpoint if rising else chance <= brkpoint) or not overall_fail > 0:
+            break
+        chance += incr
+    return 1 + cost, 1 - overall_fail
+
+
+def amoritizedActionsGrid(percents, increments, breakpoints, max_attempts=MAX_ATTEMPTS):
+    # amoritizedActions over broadcast arrays of cases, stopping at the breakpoint in the direction of
+    # the increment (>= when rising or flat, <= when falling). Returns (expected actions, overall success chance)
+    import numpy as np
+
+    percent, incr, brkpoint = np.broadcast_arrays(
+        np.asarray(percents, dtype=float), np.asarray(increments, dtype=float), np.asarray(breakpoints, dtype=float)
+    )
+    rising = incr >= 0
+    chance = percent.copy()
+    cost = np.zeros(chance.shape)
+    overall_fail = np.ones(chance.shape)
+    running = np.ones(chance.shape, dtype=bool)
+    for _ in range(max_attempts):
+        overall_fail = np.where(running, overall_fail * np.clip(1 - chance / 100, 0, 1), overall_fail)
+        cost += np.where(running, overall_fail, 0)
+        # Finished once the breakpoint is reached or there's nothing left to fail
+        running &= ~np.where(rising, chance >= brkpoint, chance <= brkpoint) & (overall_fail > 0)
+        if not running.any():
+            break
+        chance += incr
+    return 1 + cost, 1 - overall_fail
+
+
+class RetryTable:
+    # amoritizedActionsGrid over a whole grid at once, cases off the grid are worked out on demand and memoised
+    def __init__(self, percents=TABLE_PERCENTS, increments=TABLE_INCREMENTS, breakpoints=TABLE_BREAKPOINTS):
+        import numpy as np
+
+        self.percents = np.asarray(percents, dtype=float)
+        self.increments = np.asarray(increments, dtype=float)
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        # (percents x increments x breakpoints)
+        self.actions, self.success = amoritizedActionsGrid(
+            *np.meshgrid(self.percents, self.increments, self.breakpoints, indexing='ij')
+        )
+        self._percent_index = {float(v): i for i, v in enumerate(self.percents)}
+        self._increment_index = {float(v): i for i, v in enumerate(self.increments)}
+        self._breakpoint_index = {float(v): i for i, v in enumerate(self.breakpoints)}
+        self._off_grid: dict[tuple[float, float, float], tuple[float, float]] = {}
+
+    def lookup(self, percent, incr=0, brkpoint=100) -> tuple[float, float]:
+        # (expected actions, overall success chance)
+        key = (float(percent), float(incr), float(brkpoint))
+        try:
+            idx = (self._percent_index[key[0]], self._increment_index[key[1]], self._breakpoint_index[key[2]])
+            return float(self.actions[idx]), float(self.success[idx])
+        except KeyError:
+            pass
+        if key not in self._off_grid:
+            self._off_grid[key] = amoritizedActionsCase(*key)
+        return self._off_grid[key]
+
+    def rows(self):
+        # (percent, increment, breakpoint, expected actions, success chance) for every grid point
+        for i, percent in enumerate(self.percents):
+            for j, incr in enumerate(self.increments):
+                for k, brkpoint in enumerate(self.breakpoints):
+                    yield percent, incr, brkpoint, self.actions[i, j, k], self.success[i, j, k]
+
+
+_RETRY_TABLE = None
+
+
+def getRetryTable() -> RetryTable:
+    # Built on first use, shared by every activity that retries
+    global _RETRY_TABLE
+    if _RETRY_TABLE is None:
+        _RETRY_TABLE = RetryTable()
+    return _RETRY_TABLE
+
+
+_RETRY_CASES: dict[tuple[float, float, float], float] = {}
+
+
+def retryActions(percent, incr=0, brkpoint=100) -> float:
+    # Expected actions to succeed once, for catalog entries like repeated confessions
+    # A catalog only needs a handful of cases, so unless the table is already built they're worked out one at a time
+    # without numpy, which importing the catalog would otherwise have to load
+    if _RETRY_TABLE is not None:
+        return _RETRY_TABLE.lookup(percent, incr, brkpoint)[0]
+    key = (float(percent), float(incr), float(brkpoint))
+    if key not in _RETRY_CASES:
+        _RETRY_CASES[key] = amoritizedActionsCase(*key)[0]
+    return _RETRY_CASES[key]
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        # python amoritize.py table.csv -> write the whole cached table out
+        import csv
+        with open(sys.argv[1], 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['percent', 'increment', 'breakpoint', 'actions', 'success'])
+            writer.writerows(getRetryTable().rows())
+    else:
+        # print(amoritizedActions(50, -10, 20, lambda a, b: a <= b))
+        # print(amoritizedActions(50, 5))
+        print(amoritizedActions(83, 5))
+        print(amoritizedActions(100, 0))
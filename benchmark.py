@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from game import Activity, GameTree
+from instrument import Profile
+from solver import BEAM_WIDTH, SOLUTIONS_TO_KEEP, _findSolutions, _finishSolutions
+
+
+@dataclass
+class CatalogSpec:
+    name: str
+    items: int  # Total item count, spread evenly over the layers
+    depth: int  # Layers of recipes above the raw items
+    branching: int  # Alternative producers per craftable item
+    cycle_density: float = 0  # Chance a producer also consumes something from its own layer or above
+    seed: int = 0
+
+
+DEFAULT_SPECS = [
+    CatalogSpec('small', items=30, depth=3, branching=2),
+    CatalogSpec('medium', items=120, depth=4, branching=2),
+    CatalogSpec('wide', items=120, depth=3, branching=4),
+    CatalogSpec('deep', items=140, depth=6, branching=2),
+    CatalogSpec('cyclic', items=90, depth=3, branching=2, cycle_density=0.1),
+    CatalogSpec('large', items=1000, depth=6, branching=3),
+]
+# 'parallel' is the search spread over --workers processes
+DEFAULT_MODES = ['search', 'parallel', 'beam', 'lp', 'table']
+DEFAULT_WORKERS = max(2, os.cpu_count() or 1)
+# Seconds each serial search run gets. With cycles the exact search can have nothing to stop on, and a single
+# expansion can be a huge product of producer choices, so a node limit alone wouldn't cut it short
+DEFAULT_TIME_LIMIT = 10.0
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+
+def generateCatalog(spec: CatalogSpec) -> tuple[list[Activity], dict[str, float]]:
+    # Layer 0 is raw items (bought with echoes or not produced at all), every item above it has
+    # `branching` recipes drawing on lower layers, with the odd byproduct and bazaar sell like the real catalog
+    rng = random.Random(spec.seed)
+    per_layer = max(1, spec.items // (spec.depth + 1))
+    layers = [[f'item {layer}-{i}' for i in range(per_layer)] for layer in range(spec.depth + 1)]
+
+    activities = []
+    for item in layers[0]:
+        if rng.random() < 0.5:
+            activities.append(Activity(
+                description=f'bazaar purchase - {item}',
+                actions=0,
+                inputs={'echoes': round(rng.uniform(0.01, 1), 2)},
+                outputs={item: 1},
+            ))
+
+    for layer in range(1, spec.depth + 1):
+        lower_items = [item for lower in layers[:layer] for item in lower]
+        for item in layers[layer]:
+            for recipe in range(spec.branching):
+                inputs = {
+                    inp: rng.randint(1, 50)
+                    for inp in rng.sample(lower_items, min(len(lower_items), rng.randint(1, 3)))
+                }
+                if rng.random() < spec.cycle_density:
+                    # Costs at least one action so no cycle is free to go round
+                    cyclic_input = rng.choice([x for upper in layers[layer:] for x in upper])
+                    if cyclic_input != item:
+                        inputs[cyclic_input] = rng.randint(1, 5)
+                outputs = {item: rng.randint(1, 10)}
+                if rng.random() < 0.2:
+                    outputs[rng.choice(lower_items)] = rng.randint(1, 20)
+                activities.append(Activity(
+                    description=f'make {item} #{recipe}',
+                    actions=round(rng.uniform(1, 5), 2),
+                    inputs=inputs,
+                    outputs=outputs,
+                ))
+            if rng.random() < 0.3:
+                activities.append(Activity(
+                    description='bazaar sell',
+                    actions=0,
+                    inputs={item: 1},
+                    outputs={'echoes': round(rng.uniform(0.01, 5), 2)},
+                ))
+
+    intent = {layers[-1][0]: 1}
+    return activities, intent
+
+
+def _search(tree, intent, mode, keep, beam_width, workers, time_limit, profile=None):
+    if mode == 'parallel':
+        return _findSolutions(tree, intent, 'search', keep, workers, profile=profile)
+    if mode == 'search':
+        return _findSolutions(tree, intent, mode, keep, profile=profile, time_limit=time_limit)
+    return _findSolutions(tree, intent, mode, keep, beam_width=beam_width, profile=profile)
+
+
+def _runOnce(spec, mode, keep, beam_width, workers, time_limit):
+    activities, intent = generateCatalog(spec)
+
+    start = time.perf_counter()
+    tree = GameTree(activities)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = _search(tree, intent, mode, keep, beam_width, workers, time_limit)
+    search_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    solutions = _finishSolutions(tree, found, keep)
+    finish_seconds = time.perf_counter() - start
+
+    return tree, intent, solutions, index_seconds, search_seconds, finish_seconds
+
+
+def runBenchmark(
+    spec: CatalogSpec, mode: str, keep=SOLUTIONS_TO_KEEP, beam_width=BEAM_WIDTH, workers=DEFAULT_WORKERS,
+    time_limit=DEFAULT_TIME_LIMIT,
+) -> dict:
+    result = {
+        'catalog': asdict(spec),
+        'mode': mode,
+        'keep': keep,
+        'beam_width': beam_width,
+        'workers': workers if mode == 'parallel' else None,
+        'time_limit': time_limit if mode == 'search' else None,
+    }
+    if mode == 'parallel' and spec.cycle_density > 0:
+        # The parallel search takes no budget, on a cyclic catalog it could run forever
+        return {**result, 'skipped': 'parallel search has no time limit, not run on cyclic catalogs'}
+
+    tree, intent, solutions, index_seconds, search_seconds, finish_seconds = _runOnce(
+        spec, mode, keep, beam_width, workers, time_limit
+    )
+
+    # Separate passes for memory and search counters, tracemalloc and the profile would skew the timings above
+    # (worker processes aren't traced, parallel peak memory is only the parent's)
+    tracemalloc.start()
+    _runOnce(spec, mode, keep, beam_width, workers, time_limit)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    profile = Profile()
+    _search(GameTree(generateCatalog(spec)[0]), intent, mode, keep, beam_width, workers, time_limit, profile)
+
+    return {
+        **result,
+        'activities': len(tree.activities),
+        'items': len(tree.item_names),
+        'index_seconds': index_seconds,
+        'search_seconds': search_seconds,
+        'finish_seconds': finish_seconds,
+        'peak_memory_bytes': peak_memory,
+        'solutions': len(solutions),
+        'best_actions': solutions[0].total_actions if solutions != [] else None,
+        # Set when the time limit ran out before the search proved its solutions
+        'lower_bound': solutions[0].lower_bound if solutions != [] else None,
+        'search_profile': profile.toDict(),
+    }
+
+
+def _gitCommit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time GameTree indexing and solver phases on synthetic catalogs')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--modes', nargs='+', default=DEFAULT_MODES)
+    parser.add_argument('--specs', nargs='+', help='Only run the named default catalogs')
+    parser.add_argument('--items', type=int, help='Run a single custom catalog with this many items')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--branching', type=int, default=2)
+    parser.add_argument('--cycle-density', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', type=int, default=SOLUTIONS_TO_KEEP)
+    parser.add_argument('--beam-width', type=int, default=BEAM_WIDTH)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Processes for the parallel mode')
+    parser.add_argument(
+        '--time-limit', type=float, default=DEFAULT_TIME_LIMIT, help='Seconds per search mode run, 0 for no limit'
+    )
+    args = parser.parse_args()
+    time_limit = args.time_limit if args.time_limit > 0 else None
+
+    if args.items is not None:
+        specs = [CatalogSpec('custom', args.items, args.depth, args.branching, args.cycle_density, args.seed)]
+    else:
+        specs = [spec for spec in DEFAULT_SPECS if args.specs is None or spec.name in args.specs]
+
+    def write(results):
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': _gitCommit(),
+                'python': platform.python_version(),
+                'timestamp': time.time(),
+                'results': results,
+            }, f, indent=4)
+
+    # Rewritten after every run, so a suite stopped part way still leaves what it measured
+    results = []
+    for spec in specs:
+        for mode in args.modes:
+            result = runBenchmark(spec, mode, args.keep, args.beam_width, args.workers, time_limit)
+            results.append(result)
+            write(results)
+            if 'skipped' in result:
+                print(f'{spec.name:>8} {mode:>8}: skipped, {result["skipped"]}')
+                continue
+            print(
+                f'{spec.name:>8} {mode:>8}: index {result["index_seconds"]*1000:8.2f} ms, '
+                f'search {result["search_seconds"]*1000:9.2f} ms, finish {result["finish_seconds"]*1000:7.2f} ms, '
+                f'peak {result["peak_memory_bytes"]/1024:9.1f} KiB'
+                + (' (time limit hit)' if result['lower_bound'] is not None else '')
+            )
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+
+RESULT_CACHE_SIZE = 1024
+
+
+def canonicalKey(*parts) -> str:
+    # Same parts (dicts in any order) -> same key
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+class ResultCache:
+    # In-memory LRU of JSON-able results, optionally backed by a directory holding one file per key
+    # Entries are never invalidated explicitly, keys are expected to change whenever their result would
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _filePath(self, key):
+        return os.path.join(self.path, f'{key}.json')
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        if self.path is not None and os.path.exists(self._filePath(key)):
+            try:
+                with open(self._filePath(key)) as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                pass  # Half-written or corrupt, treat as missing
+            else:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = f'{self._filePath(key)}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._filePath(key))
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tomllib
+from dataclasses import asdict
+
+import game
+from game import Activity, Challenge, GameTree, LIST_OF_ACTIVITIES, Outcome, OutcomeActivity, StatActivity
+
+
+# Bump whenever GameTree/Activity change shape so stale caches are rebuilt
+CATALOG_CACHE_VERSION = 6
+CATALOG_CACHE_DIR = '.catalog_cache'
+
+
+def loadActivities(path) -> list[Activity]:
+    # JSON: a list of activities, TOML: an array of [[activity]] tables
+    # Each activity has description, actions, inputs and outputs like game.Activity,
+    # or success/rare_success/failure branches and a chance like game.OutcomeActivity
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return _parseActivities(path, raw)
+
+
+def _parseActivities(path, raw: bytes) -> list[Activity]:
+    if path.endswith('.toml'):
+        entries = tomllib.loads(raw.decode())['activity']
+    else:
+        entries = json.loads(raw)
+    return [_parseEntry(entry) for entry in entries]
+
+
+def _parseOutcome(entry) -> Outcome:
+    return Outcome(
+        actions=entry.get('actions', 0),
+        inputs=dict(entry.get('inputs', {})),
+        outputs=dict(entry.get('outputs', {})),
+    )
+
+
+def _parseEntry(entry):
+    if 'success' not in entry:
+        return Activity(
+            description=entry['description'],
+            actions=entry['actions'],
+            inputs=dict(entry.get('inputs', {})),
+            outputs=dict(entry.get('outputs', {})),
+        )
+    # chance is a probability or a {stat, difficulty, narrow, increment} table
+    chance = entry.get('chance', 1)
+    if isinstance(chance, dict):
+        chance = Challenge(**chance)
+    return OutcomeActivity(
+        description=entry['description'],
+        actions=entry['actions'],
+        success=_parseOutcome(entry['success']),
+        failure=_parseOutcome(entry.get('failure', {})),
+        chance=chance,
+        rare_success=_parseOutcome(entry['rare_success']) if 'rare_success' in entry else None,
+        rare_chance=entry.get('rare_chance', 0),
+    )
+
+
+def _dumpOutcome(outcome: Outcome) -> dict:
+    return {'actions': outcome.actions, 'inputs': outcome.inputs, 'outputs': outcome.outputs}
+
+
+def _dumpEntry(activity) -> dict:
+    if not isinstance(activity, OutcomeActivity):
+        return {
+            'description': activity.description,
+            'actions': activity.actions,
+            'inputs': activity.inputs,
+            'outputs': activity.outputs,
+        }
+    # Branches and chance as declared, so loading resolves them for whatever stats the tree is built with
+    entry = {
+        'description': activity.description,
+        'actions': activity.actions,
+        'success': _dumpOutcome(activity.success),
+        'failure': _dumpOutcome(activity.failure),
+        'chance': asdict(activity.chance) if isinstance(activity.chance, Challenge) else activity.chance,
+    }
+    if activity.rare_success is not None:
+        entry['rare_success'] = _dumpOutcome(activity.rare_success)
+        entry['rare_chance'] = activity.rare_chance
+    return entry
+
+
+def dumpActivities(activities: list[Activity], path, player_stats=None):
+    # Unresolved activities (e.g. LIST_OF_ACTIVITIES), not a GameTree's, or every stat check is baked in.
+    # A StatActivity's dependence on stats is code and can't be written out: it's refused unless
+    # player_stats is given, then written resolved for that one profile with a warning naming it
+    entries = []
+    baked = []
+    for activity in activities:
+        if isinstance(activity, StatActivity):
+            if player_stats is None:
+                raise ValueError(f'{activity.description!r} depends on player stats in code and can only be written for one profile')
+            baked.append(activity.description)
+            activity = activity.resolve(player_stats)
+        entries.append(_dumpEntry(activity))
+    if baked != []:
+        print(
+            f'WARNING: written for these stats only, --stats won\'t change them when loaded: {", ".join(baked)}\n'
+            f'         {dict(sorted(player_stats.items()))}',
+            file=sys.stderr,
+        )
+    with open(path, 'w') as f:
+        json.dump(entries, f, indent=4)
+
+
+def loadCatalog(path, cache_dir=CATALOG_CACHE_DIR, player_stats=None) -> GameTree:
+    # Parse + index once per distinct file content and stats profile, every later run just unpickles the tree
+    # Stat checks and stat-dependent yields are resolved when the tree is built, so each profile has its own entry
+    if player_stats is None:
+        player_stats = game.player_stats
+    with open(path, 'rb') as f:
+        raw = f.read()
+    content_hash = hashlib.sha256(raw).hexdigest()
+    # Levels as floats, so 300 from a JSON query and 300.0 from the command line share an entry
+    stats_hash = hashlib.sha256(
+        repr(sorted((stat, float(level)) for stat, level in player_stats.items())).encode()
+    ).hexdigest()
+
+    cache_path = None
+    if cache_dir is not None:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        cache_path = os.path.join(
+            cache_dir, f'{stem}.v{CATALOG_CACHE_VERSION}.{content_hash[:16]}.{stats_hash[:16]}.pickle'
+        )
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    version, cached_hash, cached_stats_hash, tree = pickle.load(f)
+                if version == CATALOG_CACHE_VERSION and cached_hash == content_hash and cached_stats_hash == stats_hash:
+                    return tree
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+                pass  # Corrupt or from an incompatible build, rebuild it
+
+    tree = GameTree(_parseActivities(path, raw), dict(player_stats))
+    # Fill the lazily computed fingerprint so it's cached too
+    tree.fingerprint()
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{cache_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((CATALOG_CACHE_VERSION, content_hash, stats_hash, tree), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return tree
+
+
+if __name__ == '__main__':
+    # python catalog.py export activities.json  -> write the built-in catalog out as data,
+    #                                              stat-dependent activities fixed at the default stats
+    # python catalog.py build activities.json   -> parse, index and cache a data file
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'export':
+        dumpActivities(LIST_OF_ACTIVITIES, path, game.player_stats)
+    elif command == 'build':
+        tree = loadCatalog(path)
+        print(f'{len(tree.activities)} activities, {len(tree.item_names)} items, fingerprint {tree.fingerprint()[:16]}')
+    else:
+        raise ValueError(f'Unknown command {command!r}')
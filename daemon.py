@@ -0,0 +1,131 @@
+import argparse
+import json
+import socketserver
+import sys
+import threading
+import time
+
+import game
+import solver
+from cache import ResultCache
+from catalog import loadCatalog
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class SolverService:
+    # Answers JSON queries against catalogs kept indexed between them, one GameTree per stats profile
+    # A query is {"intent": {...}} plus any of "have", "cost", "stats", "mode", "keep", "beam_width", "workers",
+    # "time_limit", "node_limit" and an "id" echoed back, or "intents": [...] to solve several against one tree
+    # With a catalog file, each profile's tree comes from (and goes into) the pickled catalog cache
+    def __init__(self, activities=None, cache_dir=None, catalog=None):
+        self.activities = activities if activities is not None else game.LIST_OF_ACTIVITIES
+        self.catalog = catalog
+        self._trees: dict[tuple, game.GameTree] = {}
+        # Repeated (or scaled) queries are answered without searching again
+        self.cache = ResultCache(path=cache_dir)
+        # Globals and per-catalog caches in the solver aren't thread safe
+        self._lock = threading.Lock()
+
+    def tree(self, player_stats) -> game.GameTree:
+        key = tuple(sorted(player_stats.items()))
+        if key not in self._trees:
+            if self.catalog is not None:
+                self._trees[key] = loadCatalog(self.catalog, player_stats=player_stats)
+            else:
+                self._trees[key] = game.GameTree(self.activities, player_stats)
+                # Fill the lazily built fingerprint now rather than in the first query that needs it
+                self._trees[key].fingerprint()
+        return self._trees[key]
+
+    def query(self, request: dict) -> dict:
+        start = time.perf_counter()
+        player_stats = {**game.player_stats, **request.get('stats', {})}
+        kwargs = dict(
+            have=request.get('have', solver.HAVE),
+            cost=request.get('cost', solver.COST),
+            mode=request.get('mode', 'search'),
+            keep=request.get('keep', solver.SOLUTIONS_TO_KEEP),
+            workers=request.get('workers'),
+            beam_width=request.get('beam_width', solver.BEAM_WIDTH),
+            time_limit=request.get('time_limit'),
+            node_limit=request.get('node_limit'),
+        )
+        with self._lock:
+            tree = self.tree(player_stats)
+            if 'intents' in request:
+                results = solver.solve_many(request['intents'], tree=tree, cache=self.cache, **kwargs)
+            else:
+                results = [solver.solve(intent=request['intent'], tree=tree, cache=self.cache, **kwargs)]
+        response = {
+            'id': request.get('id'),
+            'solutions': [[soln.toDict() for soln in solutions] for solutions in results],
+            'seconds': time.perf_counter() - start,
+        }
+        if 'intents' not in request:
+            response['solutions'] = response['solutions'][0]
+        return response
+
+    def handleLine(self, line: str) -> str:
+        # One JSON request in, one JSON response out, errors are reported rather than raised
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object')
+            response = self.query(request)
+        except Exception as e:
+            response = {
+                'id': request.get('id') if isinstance(request, dict) else None,
+                'error': f'{type(e).__name__}: {e}',
+            }
+        return json.dumps(response)
+
+
+def serveStdin(service: SolverService, stdin=sys.stdin, stdout=sys.stdout):
+    # Newline-delimited JSON, a response is flushed for every request
+    for line in stdin:
+        if line.strip() == '':
+            continue
+        stdout.write(service.handleLine(line) + '\n')
+        stdout.flush()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip() == b'':
+                continue
+            self.wfile.write((self.server.service.handleLine(line.decode()) + '\n').encode())
+            self.wfile.flush()
+
+
+class SolverServer(socketserver.ThreadingTCPServer):
+    # Same newline-delimited JSON over TCP, any number of requests per connection
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, service: SolverService, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.service = service
+        super().__init__((host, port), _RequestHandler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the solver warm and answer JSON queries one per line')
+    parser.add_argument('--port', type=int, help='Listen on localhost instead of reading stdin')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--catalog', help='JSON/TOML activity file instead of the built-in catalog')
+    parser.add_argument('--cache-dir', help='Also keep search results in this directory across restarts')
+    args = parser.parse_args()
+
+    service = SolverService(cache_dir=args.cache_dir, catalog=args.catalog)
+    # Index the default profile up front so the first query is as fast as the rest
+    service.tree(game.player_stats)
+    if args.port is None:
+        serveStdin(service)
+    else:
+        with SolverServer(service, args.host, args.port) as server:
+            print(f'Listening on {args.host}:{server.server_address[1]}', file=sys.stderr)
+            server.serve_forever()
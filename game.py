@@ -1,12 +1,21 @@
-from collections import defaultdict
-from dataclasses import dataclass
+import hashlib
+import sys
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
 from math import ceil
 from typing import List
 
+from amoritize import retryActions
+
 
 # FIXME: Rename all "actions" to "activites"
 
 
+# Outcome activities are only evaluated as one numpy batch (see outcomes.py) when a tree has at least this many,
+# fewer aren't worth loading numpy for
+OUTCOME_BATCH_MIN = 32
+
+
 player_stats = {
     "shadowy": 150,
     "watchful": 161,
@@ -22,40 +31,161 @@ class GameTree:
     global player_stats
     global LIST_OF_ACTIVITIES
 
-    def __init__(self):
+    def __init__(self, activities=None, player_stats=None):
+        if activities is None:
+            activities = LIST_OF_ACTIVITIES
+        if player_stats is None:
+            player_stats = globals()['player_stats']
+        self.player_stats = player_stats
+        # Stat-dependent activities are evaluated for this tree's profile, many outcome activities in one batch
+        activities = list(activities)
+        resolved_outcomes = {}
+        outcome_activities = [activity for activity in activities if isinstance(activity, OutcomeActivity)]
+        if len(outcome_activities) >= OUTCOME_BATCH_MIN:
+            from outcomes import resolveOutcomes
+            resolved_outcomes = dict(zip(map(id, outcome_activities), resolveOutcomes(outcome_activities, player_stats)))
+        self.activities = [
+            resolved_outcomes[id(activity)] if id(activity) in resolved_outcomes
+            else activity.resolve(player_stats) if isinstance(activity, (StatActivity, OutcomeActivity))
+            else activity
+            for activity in activities
+        ]
         self._input_index = defaultdict(list)
         self._output_index = defaultdict(list)
+        self._fingerprint = None
+        # item -> items made from it, built on first use
+        self._dependents = None
+        # (fingerprint of the tree this was edited from, items the edit can change the cost of), see withActivity
+        self._base = None
+        # Dense ids, assigned in catalog order while indexing
+        self.item_ids: dict[str, int] = {}
+        self.item_names: list[str] = []
+        # Disambiguated description -> activity id
+        self.activity_ids: dict[str, int] = {}
+        # Echoes per unit from the best-paying item -> echoes activity for each item
+        self.sell_prices: dict[str, float] = {}
+        self._sell_index: dict[str, Activity] = {}
 
         self._constructIndex()
         # print(self._input_index)
         # print(self._output_index)
 
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = catalogFingerprint(self.activities)
+        return self._fingerprint
+
+    def upstreamActivities(self, items) -> list['Activity']:
+        # Every activity that could take part in making items, in catalog order
+        seen_items = set()
+        found = {}
+        frontier = deque(items)
+        while len(frontier) > 0:
+            item = frontier.popleft()
+            if item in seen_items or item == 'echoes':
+                continue
+            seen_items.add(item)
+            for activity in self._output_index.get(item, []):
+                if activity.id not in found:
+                    found[activity.id] = activity
+                    frontier.extend(activity.inputs)
+        return [found[activity_id] for activity_id in sorted(found)]
+
+    def subsetFingerprint(self, items) -> str:
+        # Content hash of just the part of the catalog items depend on, including what their byproducts sell for
+        activities = self.upstreamActivities(items)
+        sold = sorted({out for activity in activities for out in activity.outputs} & self.sell_prices.keys())
+        h = hashlib.sha256(catalogFingerprint(activities).encode())
+        h.update(repr([(item, self.sell_prices[item]) for item in sold]).encode())
+        return h.hexdigest()
+
+    def findActivity(self, description: str) -> 'Activity':
+        return self.activities[self.activity_ids[description]]
+
+    def dependencyGraph(self) -> dict[str, set[str]]:
+        # Reverse of the input index: each item -> the items an activity consuming it makes
+        if self._dependents is None:
+            self._dependents = defaultdict(set)
+            for item, consumers in self._input_index.items():
+                for activity in consumers:
+                    self._dependents[item].update(activity.outputs)
+        return self._dependents
+
+    def downstreamItems(self, items) -> set[str]:
+        # items and every item whose cost could depend on them
+        graph = self.dependencyGraph()
+        seen = set()
+        frontier = deque(items)
+        while len(frontier) > 0:
+            item = frontier.popleft()
+            if item in seen:
+                continue
+            seen.add(item)
+            frontier.extend(graph.get(item, ()))
+        return seen
+
+    def withActivity(self, activity: 'Activity') -> 'GameTree':
+        # Copy of this tree with the activity of the same description replaced, every other activity shared.
+        # Only items downstream of what either version makes can change cost, per-catalog tables
+        # (see unitcost.getUnitCostTable) use that to update instead of starting over
+        old = self.findActivity(activity.description)
+        tree = GameTree([activity if a is old else a for a in self.activities], self.player_stats)
+        changed = set(old.outputs) | set(activity.outputs)
+        tree._base = (self.fingerprint(), frozenset(self.downstreamItems(changed) | tree.downstreamItems(changed)))
+        return tree
+
     def _constructIndex(self):
         # Need to disambiguate same-name actions
-        seen_activity_names = set()
-        for activity in LIST_OF_ACTIVITIES:
+        for activity_id, activity in enumerate(self.activities):
             activity_name = activity.description
-            if activity_name in seen_activity_names:
+            if activity_name in self.activity_ids:
                 append_int = 1
-                while f'{activity_name} ({append_int})' in seen_activity_names:
+                while f'{activity_name} ({append_int})' in self.activity_ids:
                     append_int += 1
                 # Update action itself to have the disambiguated name
                 activity_name = f'{activity_name} ({append_int})'
                 activity.description = activity_name
-            seen_activity_names.add(activity_name)
-            
+            activity.id = activity_id
+            self.activity_ids[activity_name] = activity_id
+
+            # Intern item names so every index/Counter lookup can short-circuit on identity
+            # Stat-dependent quantities can come out as 0 for some profiles, those aren't really inputs/outputs
+            activity.inputs = {
+                self._internItem(inp): quantity for inp, quantity in activity.inputs.items() if quantity != 0
+            }
+            activity.outputs = {
+                self._internItem(out): quantity for out, quantity in activity.outputs.items() if quantity != 0
+            }
+
             for inp in activity.inputs:
                 self._input_index[inp].append(activity)
             for out in activity.outputs:
                 self._output_index[out].append(activity)
 
+            if len(activity.inputs) == 1 and list(activity.outputs) == ['echoes']:
+                (item, quantity), = activity.inputs.items()
+                price = activity.outputs['echoes'] / quantity
+                # Several places may buy the same item, only the best price matters
+                if price > self.sell_prices.get(item, 0):
+                    self.sell_prices[item] = price
+                    self._sell_index[item] = activity
 
-@dataclass
+    def _internItem(self, item: str) -> str:
+        if item not in self.item_ids:
+            item = sys.intern(item)
+            self.item_ids[item] = len(self.item_names)
+            self.item_names.append(item)
+        return self.item_names[self.item_ids[item]]
+
+
+@dataclass(slots=True)
 class Activity:
     description: str
     actions: float
     inputs: dict[str, float]
     outputs: dict[str, float]
+    # Filled in by GameTree: catalog position
+    id: int = field(default=-1, repr=False, compare=False)
 
     def __hash__(self):
         return hash(self.description)
@@ -64,28 +194,181 @@ class Activity:
         return f'Activity({self.description})'
 
 
+def _evaluateForStats(value, player_stats):
+    if callable(value):
+        return value(player_stats)
+    elif isinstance(value, dict):
+        return {k: _evaluateForStats(v, player_stats) for k, v in value.items()}
+    return value
+
+
+@dataclass
+class StatActivity:
+    # Activity whose actions, inputs or outputs depend on the player's stats
+    # Any of them (or any single input/output quantity) can be a function of a player_stats dict
+    description: str
+    actions: object
+    inputs: dict
+    outputs: dict
+    _resolved: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def resolve(self, player_stats) -> Activity:
+        # Memoised per stats profile
+        key = tuple(sorted(player_stats.items()))
+        if key not in self._resolved:
+            self._resolved[key] = Activity(
+                description=self.description,
+                actions=_evaluateForStats(self.actions, player_stats),
+                inputs=_evaluateForStats(self.inputs, player_stats),
+                outputs=_evaluateForStats(self.outputs, player_stats),
+            )
+        return self._resolved[key]
+
+    def __repr__(self):
+        return f'StatActivity({self.description})'
+
+
+@dataclass
+class Challenge:
+    # A broad or narrow check of one stat against a difficulty
+    stat: str
+    difficulty: float
+    narrow: bool = False
+    increment: float = .1  # Narrow only, chance change per level away from the difficulty
+
+    def chance(self, player_stats) -> float:
+        quality = player_stats[self.stat]
+        if self.narrow:
+            return narrow(quality, self.difficulty, self.increment)
+        return broad(quality, self.difficulty)
+
+
+@dataclass
+class Outcome:
+    # What one branch of a challenge costs and yields, on top of the activity's own actions
+    actions: float = 0
+    inputs: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+
+
+@dataclass
+class OutcomeActivity:
+    # Activity declared as its success, rare success and failure branches instead of hand-worked averages
+    # chance is a fixed success probability or a Challenge, rare_chance is the share of successes that are rare
+    # Expected actions, inputs and outputs are derived per stats profile (see outcomes.py)
+    description: str
+    actions: float
+    success: Outcome
+    failure: Outcome = field(default_factory=Outcome)
+    chance: object = 1
+    rare_success: Outcome = None
+    rare_chance: float = 0
+    _resolved: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def branchChances(self, player_stats) -> tuple[float, float, float]:
+        # (success, rare success, failure)
+        chance = self.chance.chance(player_stats) if isinstance(self.chance, Challenge) else self.chance
+        rare_chance = self.rare_chance if self.rare_success is not None else 0
+        return chance * (1 - rare_chance), chance * rare_chance, 1 - chance
+
+    def branches(self) -> list[Outcome]:
+        # In branchChances order, a missing rare success never happens so any yields do
+        return [
+            self.success,
+            self.rare_success if self.rare_success is not None else self.success,
+            self.failure,
+        ]
+
+    def resolve(self, player_stats) -> Activity:
+        # Memoised per stats profile, shared with outcomes.resolveOutcomes
+        key = tuple(sorted(player_stats.items()))
+        if key not in self._resolved:
+            self._resolved[key] = self._expected(player_stats)
+        return self._resolved[key]
+
+    def _expected(self, player_stats) -> Activity:
+        # outcomes.OutcomeTable.evaluate for one activity in plain floats, summed in the same order
+        chances = [float(p) for p in self.branchChances(player_stats)]
+        actions = 0.0
+        inputs, outputs = {}, {}
+        for p, outcome in zip(chances, self.branches()):
+            actions += p * outcome.actions
+            for expected, side in ((inputs, outcome.inputs), (outputs, outcome.outputs)):
+                for item, quantity in side.items():
+                    expected[item] = expected.get(item, 0.0) + p * quantity
+        return Activity(
+            description=self.description,
+            actions=float(self.actions + actions),
+            inputs={item: quantity for item, quantity in inputs.items() if quantity > 0},
+            outputs={item: quantity for item, quantity in outputs.items() if quantity > 0},
+        )
+
+    def __repr__(self):
+        return f'OutcomeActivity({self.description})'
+
+
+def catalogFingerprint(activities: List[Activity]) -> str:
+    # Content hash of a catalog, changes whenever any activity's name, cost or yields do
+    h = hashlib.sha256()
+    for activity in activities:
+        h.update(repr((
+            activity.description,
+            activity.actions,
+            sorted(activity.inputs.items()),
+            sorted(activity.outputs.items()),
+        )).encode())
+    return h.hexdigest()
+
+
 def broad(quality, difficulty):
     return max(0, min(1, 0.6 * quality / difficulty))
 
 def narrow(quality, difficulty, increment=.1):
     if quality <= difficulty:
-        return min(increment, .5 - increment * (difficulty - quality))
+        return max(increment, .5 - increment * (difficulty - quality))
     else:
-        return max(1, .5 + increment * (quality - difficulty))
+        return min(1, .5 + increment * (quality - difficulty))
+
 
 
+@dataclass
+class HeistCard:
+    # One card of a heist's opportunity deck
+    # progress (or a function of player_stats) is what playing it is worth when its chance comes off
+    progress: object
+    chance: float = 1
+    failure_progress: float = 0
+    outputs: dict = field(default_factory=dict)  # Yields on success
+
+    def progressFor(self, player_stats) -> float:
+        return _evaluateForStats(self.progress, player_stats)
+
+    def expectedProgress(self, player_stats) -> float:
+        return self.chance * self.progressFor(player_stats) + (1 - self.chance) * self.failure_progress
+
+
+# Progress needed before the escape
+HEIST_PROGRESS = 5
+HEIST_DECKS = {
+    "shuttered": [
+        HeistCard(1), HeistCard(0), HeistCard(2), HeistCard(1, chance=.4), HeistCard(2), HeistCard(1),
+    ],
+    "triple-bolted": [
+        HeistCard(1), HeistCard(2), HeistCard(0), HeistCard(1), HeistCard(2), HeistCard(2), HeistCard(1, chance=.4),
+        # tds yield with favours
+        HeistCard(lambda stats: 2 if stats['shadowy'] >= 100 else 0),
+        HeistCard(1),
+    ],
+}
+
 
 def computeHeistActions(player_stats, heist_security) -> float:
-    # Upper bound average assuming you have one card slot
+    # Average assuming you have one card slot
     # Assume there are enough favors
-    if heist_security == "shuttered":
-        return 1 + 5 / ((1 + 0 + 2 + 0.4 + 2 + 1)/6)
-    elif heist_security == "triple-bolted":
-        tds_yield_with_favors = (
-            2 if player_stats['shadowy'] >= 100
-            else 0
-        )
-        return 1 + 5 / ((1 + 2 + 0 + 1 + 2 + 2 + 0.4 + tds_yield_with_favors + 1)/9)
+    # Progress past the target on the last card is ignored, so this is a lower bound really,
+    # simulate.simulateHeist gives the full distribution for the same deck
+    deck = HEIST_DECKS[heist_security]
+    return 1 + HEIST_PROGRESS / (sum(card.expectedProgress(player_stats) for card in deck) / len(deck))
 
 
 def levelToCP(level):
@@ -97,9 +380,9 @@ def levelToCP(level):
 
 
 LIST_OF_ACTIVITIES = [
-    # Activity(
+    # StatActivity(
     #     description="heist - balustraded house in elderwick",
-    #     actions=computeHeistActions(player_stats, "triple-bolted"),
+    #     actions=lambda stats: computeHeistActions(stats, "triple-bolted"),
     #     inputs={
     #         "casing": levelToCP(8),
     #         "favours: criminals": 5,
@@ -112,9 +395,9 @@ LIST_OF_ACTIVITIES = [
     #         "puzzle-damask scrap": 1,
     #     },
     # ),
-    # Activity(
+    # StatActivity(
     #     description="heist - balustraded house in elderwick",
-    #     actions=computeHeistActions(player_stats, "triple-bolted"),
+    #     actions=lambda stats: computeHeistActions(stats, "triple-bolted"),
     #     inputs={
     #         "casing": levelToCP(8),
     #         "favours: criminals": 5,
@@ -293,23 +576,33 @@ LIST_OF_ACTIVITIES = [
             "bottle of greyfields 1879": 1,
         },
     ),
-    Activity(
+    OutcomeActivity(
         description="doing the decent thing",
         actions=1,
-        inputs={},
-        outputs={
-            # TODO: Automate away this calculation
-            # 63% success (7% rare success)
-            # 30% failure
-            "drop of prisoner's honey": .63*50 + .07*(100-11)/2,
-            "stolen kiss": 0.07,
-            "scandal": 0.6,
-        },
+        # 70% success, a tenth of which are rare
+        chance=.7,
+        success=Outcome(
+            outputs={
+                "drop of prisoner's honey": 50,
+            },
+        ),
+        rare_chance=.1,
+        rare_success=Outcome(
+            outputs={
+                "drop of prisoner's honey": (100-11)/2,
+                "stolen kiss": 1,
+            },
+        ),
+        failure=Outcome(
+            outputs={
+                "scandal": 2,
+            },
+        ),
     ),
-    # Activity(
+    # StatActivity(
     #     description="heist - mansion of an unsympathetic landlord",
     #     # TODO: Fix to be well-guarded
-    #     actions=computeHeistActions(player_stats, "triple-bolted"),
+    #     actions=lambda stats: computeHeistActions(stats, "triple-bolted"),
     #     inputs={
     #         "casing": levelToCP(8),
     #     },
@@ -340,21 +633,32 @@ LIST_OF_ACTIVITIES = [
             "echoes": 0.03,
         },
     ),
-    Activity(
+    OutcomeActivity(
         description="thefts of a particular character - bazaar permit",
         actions=1,
-        # ~52% success
-        inputs={
-            "casing": .52*32 + .48*51,
-        },
-        outputs={
-            "bazaar permit": 1,
-        },
+        # ~52% success, failing still gets the permit but burns more casing
+        chance=.52,
+        success=Outcome(
+            inputs={
+                "casing": 32,
+            },
+            outputs={
+                "bazaar permit": 1,
+            },
+        ),
+        failure=Outcome(
+            inputs={
+                "casing": 51,
+            },
+            outputs={
+                "bazaar permit": 1,
+            },
+        ),
     ),
-    Activity(
+    StatActivity(
         description="heist - mr baseborn's papers",
         # TODO: Fix to be well-guarded
-        actions=computeHeistActions(player_stats, "triple-bolted") + 2,
+        actions=lambda stats: computeHeistActions(stats, "triple-bolted") + 2,
         inputs={
             "casing": levelToCP(8),
         },
@@ -481,17 +785,17 @@ LIST_OF_ACTIVITIES = [
             "piece of rostygold": 1,
         },
     ),
-    Activity(
+    StatActivity(
         # TODO: Split this into two activities? Requires solver handling of spending all
         description="underclay - send unfinished to spite",
-        actions=(
+        actions=lambda stats: (
             2 # enter exit
-            + 2 / broad(player_stats['shadowy'], 125) # assume 30 stone confession action
+            + 2 * retryActions(100 * broad(stats['shadowy'], 125)) # assume 30 stone confession action
         ),
         inputs={},
         outputs={
             "strong-backed labour": 3,
-            "shard of glim": ((ceil(2 / broad(player_stats['shadowy'], 125)) * 30) % 50) * 10,
+            "shard of glim": lambda stats: ((ceil(2 / broad(stats['shadowy'], 125)) * 30) % 50) * 10,
         },
     ),
     Activity(
@@ -0,0 +1,58 @@
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+class Profile:
+    # Opt-in counters and timers for one solve() call: pass one in, read it back afterwards
+    # Every hook in the solver sits behind `if profile is not None`, so leaving it off costs one comparison
+    def __init__(self, sample_every=100):
+        self.sample_every = sample_every
+        self.counters = Counter()
+        self.seconds = defaultdict(float)
+        # Size of each cartesian product of producers -> how many times it happened
+        self.fan_outs = Counter()
+        # (nodes expanded so far, frontier size) every sample_every expansions
+        self.frontier = []
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def addTime(self, name, seconds):
+        self.seconds[name] += seconds
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def fanOut(self, size):
+        self.fan_outs[size] += 1
+
+    def expanded(self, frontier_size):
+        self.counters['nodes_expanded'] += 1
+        if self.counters['nodes_expanded'] % self.sample_every == 0:
+            self.frontier.append((self.counters['nodes_expanded'], frontier_size))
+
+    def merge(self, other: dict):
+        # Fold in a toDict() from another process, frontier samples are kept per process so not merged
+        self.counters.update(other['counters'])
+        for name, seconds in other['seconds'].items():
+            self.seconds[name] += seconds
+        self.fan_outs.update({int(size): n for size, n in other['fan_outs'].items()})
+
+    def toDict(self):
+        return {
+            'counters': dict(self.counters),
+            'seconds': dict(self.seconds),
+            'fan_outs': {str(size): n for size, n in sorted(self.fan_outs.items())},
+            'max_fan_out': max(self.fan_outs, default=0),
+            'frontier': self.frontier,
+        }
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
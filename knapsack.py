@@ -0,0 +1,105 @@
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from game import Activity
+
+
+@dataclass
+class Trade:
+    item: str
+    cost: int  # Whole points of the quality spent, e.g. CP
+    value: float
+
+
+class KnapsackTable:
+    # Unbounded knapsack over every budget 0..max_budget at once: best total value of trades costing at most the budget
+    # Only a value and a back-pointer per budget are kept, the trades behind a budget are rebuilt on demand
+    def __init__(self, trades: list[Trade], max_budget: int):
+        self.trades = list(trades)
+        self.max_budget = max_budget
+        self.costs = np.array([trade.cost for trade in self.trades], dtype=int)
+        if np.any(self.costs <= 0):
+            raise ValueError('Trades must cost at least 1')
+        self.values = np.zeros(max_budget + 1)
+        # Trade taken last at each budget, -1 where the budget is better left one point short
+        self.choices = np.full(max_budget + 1, -1, dtype=int)
+        budgets = np.arange(max_budget + 1)
+
+        for t, trade in enumerate(self.trades):
+            # With this trade available best[b] = max over k of (previous[b - k*cost] + k*value), which is a
+            # running max down each budget residue class mod cost, so one reshape handles every budget
+            cost = trade.cost
+            rows = -(-(max_budget + 1) // cost)
+            previous = np.full(rows * cost, -np.inf)
+            previous[:max_budget + 1] = self.values
+            steps = np.arange(rows)[:, None]
+            shifted = previous.reshape(rows, cost) - steps * trade.value
+            best = (np.maximum.accumulate(shifted, axis=0) + steps * trade.value).ravel()[:max_budget + 1]
+            # Ties keep the earlier trade
+            improved = best > self.values + 1e-12
+            self.values = np.where(improved, best, self.values)
+            self.choices = np.where(improved, t, self.choices)
+
+        # Leaving points unspent is allowed, so carry better values up to larger budgets
+        carried = np.maximum.accumulate(self.values)
+        left_short = carried > self.values + 1e-12
+        self.values = carried
+        self.choices[left_short] = -1
+        # Budget each budget's best set continues from
+        self.parents = np.where(self.choices >= 0, budgets - self.costs[self.choices], budgets - 1)
+        self.parents[0] = 0
+
+    def bestValue(self, budget: int) -> float:
+        return float(self.values[budget])
+
+    def tradesFor(self, budget: int) -> Counter:
+        counts = Counter()
+        while budget > 0:
+            if self.choices[budget] >= 0:
+                counts[self.trades[self.choices[budget]].item] += 1
+            budget = int(self.parents[budget])
+        return counts
+
+    def tradeCounts(self) -> np.ndarray:
+        # (budgets x trades) counts for every budget in one go, summing along the back-pointers by pointer jumping
+        budgets = self.max_budget + 1
+        counts = np.zeros((budgets, len(self.trades)), dtype=np.int64)
+        taken = self.choices >= 0
+        counts[np.flatnonzero(taken), self.choices[taken]] = 1
+        counts[0] = 0
+        parents = self.parents.copy()
+        # Budget 0 is its own parent with nothing taken, so jumping past it adds nothing
+        while np.any(parents != 0):
+            counts += counts[parents]
+            parents = parents[parents]
+        return counts
+
+    def wikiTable(self, items: list[str]) -> str:
+        # Rows of a wiki table, the chosen trade counts of every budget in the given column order
+        counts = self.tradeCounts()
+        columns = [[t for t, trade in enumerate(self.trades) if trade.item == item] for item in items]
+        lines = []
+        for budget in range(self.max_budget + 1):
+            cells = [str(budget)] + [str(int(counts[budget, column].sum())) for column in columns]
+            lines.append('|-')
+            lines.append('| ' + ' || '.join(cells))
+        return '\n'.join(lines)
+
+
+def tradeInActivities(quality: str, trades: list[Trade], budgets: list[int], description='trade in') -> list[Activity]:
+    # Activities spending budget points of quality on their best trades, so the solver can value a quality
+    # that is only ever redeemed through trade-ins (and sell what comes out at the bazaar)
+    table = KnapsackTable(trades, max(budgets))
+    activities = []
+    for budget in budgets:
+        outputs = dict(table.tradesFor(budget))
+        if outputs != {}:
+            activities.append(Activity(
+                description=f'{description} - {budget} {quality}',
+                actions=1,
+                inputs={quality: budget},
+                outputs=outputs,
+            ))
+    return activities
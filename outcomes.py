@@ -0,0 +1,135 @@
+import numpy as np
+
+from game import Activity, Challenge, OutcomeActivity
+
+
+# Branch order of every (activities x branches) array
+BRANCHES = ('success', 'rare_success', 'failure')
+
+
+def broadChances(quality, difficulty):
+    # game.broad over arrays
+    return np.clip(0.6 * quality / difficulty, 0, 1)
+
+
+def narrowChances(quality, difficulty, increment):
+    # game.narrow over arrays
+    return np.clip(.5 + increment * (quality - difficulty), increment, 1)
+
+
+def _statsKey(player_stats):
+    return tuple(sorted(player_stats.items()))
+
+
+class _BranchYields:
+    # Sparse (activity, branch, item, quantity) entries for one side (inputs or outputs) of many activities
+    # Entries for the same activity and item share a pair, the expected quantity is summed per pair
+    def __init__(self, activities, side):
+        pair_ids = {}
+        self.pair_items: list[str] = []
+        self.pair_slices: list[tuple[int, int]] = []  # Each activity's pairs are contiguous, in declaration order
+        pairs, rows, branches, quantities = [], [], [], []
+        for row, activity in enumerate(activities):
+            start = len(self.pair_items)
+            for branch, outcome in enumerate(activity.branches()):
+                for item, quantity in getattr(outcome, side).items():
+                    if (row, item) not in pair_ids:
+                        pair_ids[(row, item)] = len(self.pair_items)
+                        self.pair_items.append(item)
+                    pairs.append(pair_ids[(row, item)])
+                    rows.append(row)
+                    branches.append(branch)
+                    quantities.append(quantity)
+            self.pair_slices.append((start, len(self.pair_items)))
+        self.pairs = np.array(pairs, dtype=int)
+        self.rows = np.array(rows, dtype=int)
+        self.branches = np.array(branches, dtype=int)
+        self.quantities = np.array(quantities, dtype=float)
+
+    def expected(self, p: np.ndarray) -> np.ndarray:
+        # Expected quantity of every (activity, item) pair given (activities x branches) probabilities
+        return np.bincount(
+            self.pairs, weights=p[self.rows, self.branches] * self.quantities, minlength=len(self.pair_items)
+        )
+
+    def toDict(self, row, values) -> dict[str, float]:
+        start, end = self.pair_slices[row]
+        return {self.pair_items[k]: float(values[k]) for k in range(start, end) if values[k] > 0}
+
+
+class OutcomeTable:
+    # Branch chances and yields of many outcome activities as arrays,
+    # so the whole lot is re-evaluated for a new stats profile in one pass
+    def __init__(self, activities: list[OutcomeActivity]):
+        self.activities = list(activities)
+        self.base_actions = np.array([activity.actions for activity in self.activities], dtype=float)
+        self.branch_actions = np.array(
+            [[outcome.actions for outcome in activity.branches()] for activity in self.activities], dtype=float
+        ).reshape(len(self.activities), len(BRANCHES))
+        self.inputs = _BranchYields(self.activities, 'inputs')
+        self.outputs = _BranchYields(self.activities, 'outputs')
+
+        # Fixed chances, or the challenge each activity's chance comes from
+        challenges = [activity.chance if isinstance(activity.chance, Challenge) else None for activity in self.activities]
+        self.challenged = np.array([c is not None for c in challenges], dtype=bool)
+        self.fixed_chance = np.array([
+            activity.chance if c is None else 1
+            for activity, c in zip(self.activities, challenges)
+        ], dtype=float)
+        self.rare_chance = np.array([
+            activity.rare_chance if activity.rare_success is not None else 0
+            for activity in self.activities
+        ], dtype=float)
+        self.stat_names = sorted({c.stat for c in challenges if c is not None})
+        stat_ids = {stat: j for j, stat in enumerate(self.stat_names)}
+        # Placeholder stat/difficulty for unchallenged rows keeps the arithmetic finite, their chance is fixed_chance
+        self.stat_index = np.array([stat_ids[c.stat] if c is not None else 0 for c in challenges], dtype=int)
+        self.difficulty = np.array([c.difficulty if c is not None else 1 for c in challenges], dtype=float)
+        self.narrow = np.array([c is not None and c.narrow for c in challenges], dtype=bool)
+        self.increment = np.array([c.increment if c is not None else .1 for c in challenges], dtype=float)
+
+        self._evaluated: dict[tuple, list[Activity]] = {}
+
+    def chances(self, player_stats) -> np.ndarray:
+        # (activities x branches) probabilities, every row sums to 1
+        if self.stat_names != []:
+            quality = np.array([player_stats[stat] for stat in self.stat_names], dtype=float)[self.stat_index]
+        else:
+            quality = np.zeros(len(self.activities))
+        chance = np.where(
+            self.narrow,
+            narrowChances(quality, self.difficulty, self.increment),
+            broadChances(quality, self.difficulty),
+        )
+        chance = np.where(self.challenged, chance, self.fixed_chance)
+        return np.stack([chance * (1 - self.rare_chance), chance * self.rare_chance, 1 - chance], axis=1)
+
+    def evaluate(self, player_stats) -> list[Activity]:
+        # Memoised per stats profile
+        key = _statsKey(player_stats)
+        if key not in self._evaluated:
+            p = self.chances(player_stats)
+            actions = self.base_actions + (p * self.branch_actions).sum(axis=1)
+            inputs = self.inputs.expected(p)
+            outputs = self.outputs.expected(p)
+            self._evaluated[key] = [
+                Activity(
+                    description=activity.description,
+                    actions=float(actions[i]),
+                    inputs=self.inputs.toDict(i, inputs),
+                    outputs=self.outputs.toDict(i, outputs),
+                )
+                for i, activity in enumerate(self.activities)
+            ]
+        return self._evaluated[key]
+
+
+def resolveOutcomes(activities: list[OutcomeActivity], player_stats) -> list[Activity]:
+    # Each activity memoises its resolved form per stats profile like StatActivity does,
+    # whatever hasn't been seen with these stats yet is evaluated in one batch, the same as OutcomeActivity.resolve would
+    key = _statsKey(player_stats)
+    pending = list({id(activity): activity for activity in activities if key not in activity._resolved}.values())
+    if pending != []:
+        for activity, resolved in zip(pending, OutcomeTable(pending).evaluate(player_stats)):
+            activity._resolved[key] = resolved
+    return [activity._resolved[key] for activity in activities]
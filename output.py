@@ -0,0 +1,76 @@
+import csv
+import json
+import sys
+
+
+OUTPUT_FORMATS = ('table', 'json', 'csv')
+# One csv row per activity, leftover, open input, sale or use of inventory in a solution,
+# its lower bound if the search ran out of budget and the branches beam mode discarded
+CSV_COLUMNS = ['query', 'rank', 'actions', 'net_actions', 'kind', 'name', 'quantity', 'echoes']
+
+
+def formatIntent(intent: dict[str, float]) -> str:
+    return ', '.join(f'{quantity:g}x {item}' for item, quantity in intent.items())
+
+
+class SolutionWriter:
+    # Writes solutions the moment they're handed over and flushes after each, so whatever reads the stream
+    # sees them while later queries are still being solved.
+    # table: Solution.pprint between borders, json: one object per line, csv: CSV_COLUMNS rows
+    def __init__(self, fmt='table', out=None, cost=None, headings=False):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format {fmt!r}')
+        self.fmt = fmt
+        self.out = out if out is not None else sys.stdout
+        self.cost = cost if cost is not None else {}
+        # Name each query's intent above its solutions in table output
+        self.headings = headings
+        self._csv = None
+
+    def writeQuery(self, query: int, intent: dict[str, float], solutions):
+        if self.fmt == 'table':
+            from solver import SOLUTION_BORDER, bold
+            if self.headings:
+                print(f'{bold("Intent:")} {formatIntent(intent)}', file=self.out)
+            print(SOLUTION_BORDER, file=self.out)
+        for rank, soln in enumerate(solutions):
+            self.write(query, intent, rank, soln)
+        self.out.flush()
+
+    def write(self, query: int, intent: dict[str, float], rank: int, soln):
+        if self.fmt == 'table':
+            from solver import SOLUTION_BORDER
+            soln.pprint(self.out)
+            print(SOLUTION_BORDER, file=self.out)
+        elif self.fmt == 'json':
+            self.out.write(json.dumps({
+                'query': query,
+                'intent': intent,
+                'rank': rank,
+                'net_actions': float(soln.netActions(self.cost)),
+                **soln.toDict(),
+            }) + '\n')
+        else:
+            if self._csv is None:
+                self._csv = csv.writer(self.out)
+                self._csv.writerow(CSV_COLUMNS)
+            self._csv.writerows(self._csvRows(query, rank, soln))
+        self.out.flush()
+
+    def _csvRows(self, query, rank, soln):
+        solution = soln.toDict()
+        prefix = [query, rank, solution['actions'], float(soln.netActions(self.cost))]
+        for step in solution['sequence']:
+            yield prefix + ['activity', step['activity'], step['quantity'], '']
+        for item, quantity in solution['inputs'].items():
+            yield prefix + ['input', item, quantity, '']
+        for item, quantity in solution['outputs'].items():
+            yield prefix + ['output', item, quantity, '']
+        for sale in solution['sold']:
+            yield prefix + ['sold', sale['item'], sale['quantity'], sale['echoes']]
+        for item, quantity in solution['from_inventory'].items():
+            yield prefix + ['from_inventory', item, quantity, '']
+        if 'lower_bound' in solution:
+            yield prefix + ['lower_bound', '', solution['lower_bound'], '']
+        if 'discarded' in solution:
+            yield prefix + ['discarded', '', solution['discarded'], '']
@@ -0,0 +1,167 @@
+EPSILON = 1e-9
+PIVOT_EPSILON = 1e-7
+# Degenerate pivots in a row before switching to Bland's rule
+BLAND_AFTER = 50
+PERTURBATION = 1e-6
+
+
+class Unbounded(Exception):
+    pass
+
+
+def _pivot(tableau, objective, basis, row, col):
+    pivot_row = tableau[row]
+    pivot_val = pivot_row[col]
+    for j in range(len(pivot_row)):
+        pivot_row[j] /= pivot_val
+
+    for other in tableau + [objective]:
+        if other is pivot_row:
+            continue
+        factor = other[col]
+        if abs(factor) > EPSILON:
+            for j in range(len(other)):
+                other[j] -= factor * pivot_row[j]
+    basis[row] = col
+
+
+def _ratioTest(tableau, basis, entering, use_bland):
+    leaving = None
+    best_ratio = None
+    for i, row in enumerate(tableau):
+        # Tiny pivot elements are float noise, pivoting on them blows the tableau up
+        if row[entering] > PIVOT_EPSILON:
+            ratio = max(row[-1], 0) / row[entering]
+            if best_ratio is None or ratio < best_ratio - EPSILON:
+                best_ratio = ratio
+                leaving = i
+            elif abs(ratio - best_ratio) <= EPSILON:
+                if use_bland:
+                    if basis[i] < basis[leaving]:
+                        leaving = i
+                elif row[entering] > tableau[leaving][entering]:
+                    leaving = i
+    return leaving, best_ratio
+
+
+def _iterate(tableau, objective, basis, allowed_cols):
+    # Dantzig's rule (most negative reduced cost) while pivots make progress, then Bland's rule
+    # (lowest index entering + leaving) after a run of degenerate pivots so they can't cycle
+    allowed_cols = list(allowed_cols)
+    degenerate_streak = 0
+    while True:
+        use_bland = degenerate_streak >= BLAND_AFTER
+        candidates = [j for j in allowed_cols if objective[j] < -EPSILON]
+        if not use_bland:
+            candidates.sort(key=lambda j: objective[j])
+        if candidates == []:
+            return
+
+        for entering in candidates:
+            leaving, best_ratio = _ratioTest(tableau, basis, entering, use_bland)
+            if leaving is not None:
+                break
+            if all(row[entering] <= EPSILON for row in tableau):
+                raise Unbounded()
+            # Only noise-sized pivots in this column, try the next one
+        else:
+            return
+
+        degenerate_streak = degenerate_streak + 1 if best_ratio <= EPSILON else 0
+        _pivot(tableau, objective, basis, leaving, entering)
+        for row in tableau:
+            if -EPSILON < row[-1] < 0:
+                row[-1] = 0.0
+
+
+def minimize(costs: list[float], rows: list[list[float]], rhs: list[float]):
+    # Minimise costs . x subject to rows[i] . x >= rhs[i] and x >= 0
+    # Two-phase tableau simplex, returns x or None if infeasible
+    n = len(costs)
+    m = len(rows)
+
+    # Columns are [x (n), surplus (m), artificial (m)], last entry of each row is the rhs
+    width = n + 2 * m + 1
+    tableau = []
+    basis = []
+    artificial_rows = []
+    # Surplus column of each row as stored (+-1) and the unperturbed rhs as stored
+    surplus_signs = []
+    exact_rhs = []
+    for i, (row, b) in enumerate(zip(rows, rhs)):
+        # Scale each row to unit max coefficient, keeps pivots comparable across rows
+        scale = max((abs(v) for v in row), default=0)
+        if scale > 0:
+            row = [v / scale for v in row]
+            b = b / scale
+        # Most balance rows are "net production >= 0", which makes nearly every vertex degenerate.
+        # Solve a slightly relaxed problem with distinct rhs instead, then recover the exact x at the end.
+        perturbed_b = b - PERTURBATION * (1 + i / max(m, 1))
+        t_row = [0.0] * width
+        if perturbed_b >= 0:
+            # row . x - s_i + a_i = b
+            for j, v in enumerate(row):
+                t_row[j] = float(v)
+            t_row[n + i] = -1.0
+            t_row[n + m + i] = 1.0
+            t_row[-1] = float(perturbed_b)
+            basis.append(n + m + i)
+            artificial_rows.append(i)
+            surplus_signs.append(-1.0)
+            exact_rhs.append(float(b))
+        else:
+            # -row . x + s_i = -b, surplus is a feasible starting basis
+            for j, v in enumerate(row):
+                t_row[j] = -float(v)
+            t_row[n + i] = 1.0
+            t_row[-1] = -float(perturbed_b)
+            basis.append(n + i)
+            surplus_signs.append(1.0)
+            exact_rhs.append(-float(b))
+        tableau.append(t_row)
+
+    # Phase 1: minimise the sum of artificials
+    objective = [0.0] * width
+    for i in artificial_rows:
+        objective[n + m + i] = 1.0
+    for i in artificial_rows:
+        for j in range(width):
+            objective[j] -= tableau[i][j]
+    _iterate(tableau, objective, basis, range(n + 2 * m))
+    if -objective[-1] > EPSILON * max(1, m):
+        return None
+
+    # Drive any zero-level artificials out of the basis, dropping redundant rows
+    for i in reversed(range(len(tableau))):
+        if basis[i] < n + m:
+            continue
+        for j in range(n + m):
+            if abs(tableau[i][j]) > EPSILON:
+                _pivot(tableau, objective, basis, i, j)
+                break
+        else:
+            del tableau[i]
+            del basis[i]
+
+    # Phase 2: original objective over structural + surplus columns
+    objective = [0.0] * width
+    for j in range(n):
+        objective[j] = float(costs[j])
+    for i, col in enumerate(basis):
+        c_b = objective[col]
+        if c_b != 0:
+            for j in range(width):
+                objective[j] -= c_b * tableau[i][j]
+    _iterate(tableau, objective, basis, range(n + m))
+
+    # The surplus columns hold the basis inverse (times their sign), so x_B = B^-1 b for the exact b
+    x = [0.0] * n
+    for r, col in enumerate(basis):
+        if col < n:
+            value = sum(
+                exact_rhs[i] * surplus_signs[i] * tableau[r][n + i]
+                for i in range(m)
+                if exact_rhs[i] != 0
+            )
+            x[col] = max(value, 0.0)
+    return x
@@ -0,0 +1,131 @@
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from game import HEIST_DECKS, HEIST_PROGRESS, broad, computeHeistActions, player_stats as PLAYER_STATS
+
+
+RUNS = 1_000_000
+# Runs simulated at once, bounds memory on big runs
+BATCH_SIZE = 1_000_000
+# Cards drawn before a heist that can't make progress is given up on
+MAX_DRAWS = 1000
+SEED = 0
+
+
+@dataclass
+class Distribution:
+    # Per-run totals of a simulated activity
+    actions: np.ndarray
+    outputs: dict[str, np.ndarray]
+
+    def mean(self) -> float:
+        return float(self.actions.mean())
+
+    def summary(self, percentiles=(5, 50, 95)) -> dict:
+        return {
+            'runs': len(self.actions),
+            'actions': {
+                'mean': self.mean(),
+                'std': float(self.actions.std()),
+                **{f'p{p}': float(v) for p, v in zip(percentiles, np.percentile(self.actions, percentiles))},
+            },
+            'outputs': {item: float(quantities.mean()) for item, quantities in self.outputs.items()},
+        }
+
+
+def _batches(runs):
+    for start in range(0, runs, BATCH_SIZE):
+        yield min(BATCH_SIZE, runs - start)
+
+
+def _simulateDeck(rng, n, progress, chance, failure_progress, card_outputs, target):
+    # n heists at once: every step each unfinished heist draws one card (one card slot) and plays it
+    actions = np.ones(n)  # Getting in
+    total = np.zeros(n)
+    outputs = {item: np.zeros(n) for item in card_outputs}
+    active = np.arange(n)
+    for _ in range(MAX_DRAWS):
+        if active.size == 0:
+            break
+        cards = rng.integers(len(progress), size=active.size)
+        success = rng.random(active.size) < chance[cards]
+        total[active] += np.where(success, progress[cards], failure_progress[cards])
+        actions[active] += 1
+        for item, per_card in card_outputs.items():
+            outputs[item][active] += np.where(success, per_card[cards], 0)
+        active = active[total[active] < target]
+    return actions, outputs
+
+
+def simulateHeist(player_stats, heist_security, runs=RUNS, seed=SEED) -> Distribution:
+    # Same deck and assumptions as game.computeHeistActions, but the whole distribution instead of 1 + progress / mean
+    deck = HEIST_DECKS[heist_security]
+    progress = np.array([card.progressFor(player_stats) for card in deck], dtype=float)
+    chance = np.array([card.chance for card in deck], dtype=float)
+    failure_progress = np.array([card.failure_progress for card in deck], dtype=float)
+    items = list(dict.fromkeys(item for card in deck for item in card.outputs))
+    card_outputs = {item: np.array([card.outputs.get(item, 0) for card in deck], dtype=float) for item in items}
+
+    rng = np.random.default_rng(seed)
+    batches = [
+        _simulateDeck(rng, n, progress, chance, failure_progress, card_outputs, HEIST_PROGRESS)
+        for n in _batches(runs)
+    ]
+    return Distribution(
+        actions=np.concatenate([actions for actions, _ in batches]),
+        outputs={item: np.concatenate([outputs[item] for _, outputs in batches]) for item in items},
+    )
+
+
+def simulateRetries(chance, successes=1, overhead=0, runs=RUNS, seed=SEED) -> Distribution:
+    # Attempts at a fixed chance until successes of them pass, plus overhead actions per run
+    rng = np.random.default_rng(seed)
+    actions = np.concatenate([
+        overhead + successes + rng.negative_binomial(successes, chance, size=n)
+        for n in _batches(runs)
+    ]).astype(float)
+    return Distribution(actions=actions, outputs={})
+
+
+def simulateUnderclay(player_stats, runs=RUNS, seed=SEED) -> Distribution:
+    # "underclay - send unfinished to spite": enter and exit, and two confessions at a broad shadowy 125 check
+    return simulateRetries(broad(player_stats['shadowy'], 125), successes=2, overhead=2, runs=runs, seed=seed)
+
+
+_CALIBRATED: dict[tuple, float] = {}
+
+
+def simulatedHeistActions(player_stats, heist_security, runs=200_000, seed=SEED) -> float:
+    # Drop-in for game.computeHeistActions in a StatActivity, memoised per stats profile
+    key = (tuple(sorted(player_stats.items())), heist_security, runs, seed)
+    if key not in _CALIBRATED:
+        _CALIBRATED[key] = simulateHeist(player_stats, heist_security, runs, seed).mean()
+    return _CALIBRATED[key]
+
+
+if __name__ == '__main__':
+    # python simulate.py [runs] -> analytic vs simulated actions for every heist deck and the underclay
+    import time
+
+    from tabulate import tabulate
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    rows = []
+    for heist_security in HEIST_DECKS:
+        start = time.perf_counter()
+        summary = simulateHeist(PLAYER_STATS, heist_security, runs).summary()
+        rows.append((
+            f'heist ({heist_security})', computeHeistActions(PLAYER_STATS, heist_security),
+            summary['actions']['mean'], summary['actions']['p5'], summary['actions']['p50'], summary['actions']['p95'],
+            time.perf_counter() - start,
+        ))
+    start = time.perf_counter()
+    summary = simulateUnderclay(PLAYER_STATS, runs).summary()
+    rows.append((
+        'underclay', 2 + 2 / broad(PLAYER_STATS['shadowy'], 125),
+        summary['actions']['mean'], summary['actions']['p5'], summary['actions']['p50'], summary['actions']['p95'],
+        time.perf_counter() - start,
+    ))
+    print(tabulate(rows, headers=['Activity', 'Analytic', 'Simulated', 'p5', 'p50', 'p95', 'Seconds'], floatfmt='.4g'))
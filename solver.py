@@ -1,13 +1,17 @@
+import heapq
 import itertools
 import math
+import time
 from collections import Counter, deque
+from contextlib import nullcontext
 from copy import deepcopy
 from dataclasses import dataclass
 
-from tabulate import tabulate
-from termcolor import colored
-
+from cache import ResultCache, canonicalKey
 from game import Activity, GameTree, LIST_OF_ACTIVITIES
+from instrument import Profile
+from simplex import minimize
+from unitcost import getUnitCostTable
 
 
 INTENT = {
@@ -33,32 +37,105 @@ TRY_TO_SELL_OUTPUTS = True
 SOLUTION_BORDER = '-' * 50
 MERGE_SOLUTION_SEQUENCES = True
 SOLUTIONS_TO_KEEP = 3
+# Write a JSON profile of the search here (see instrument.Profile), None to skip instrumentation
+PROFILE_OUTPUT = None
+# Keep search results in this directory between runs, None to keep them for this process only
+RESULT_CACHE_DIR = None
+# Bump whenever the search can return different solutions for the same query, so cached ones are ignored
+RESULT_CACHE_VERSION = 4
+# Relative yield changes tried by sensitivity()
+SENSITIVITY_CHANGES = (-0.1, 0.1)
+# Partial solutions kept per depth in beam mode
+BEAM_WIDTH = 100
+# Per-unit penalty on every LP activity so zero-action purchases aren't made for nothing
+LP_TIEBREAK = 1e-6
 
-# TODO: Unimplemented
+# Inventory the player already holds, used up before anything is produced or bought
 HAVE = {
     "echoes": 34.84,
 }
 COST = {
     "action": 1,
+    # Actions one echo is worth, set to rank solutions by actions net of what their leftovers sell for
+    # "echoes": 0.15,
 }
 MAX_UNSOLVED_INPUTS = 3
+# Open inputs this small are float leftovers from cancelling inputs against outputs, not real wants
+RESIDUE = 1e-9
+# Expansions along any one branch before it is abandoned, cycles through byproducts never finish otherwise
+MAX_SEARCH_DEPTH = 50
+# With a time or node budget, dive greedily to a complete solution from every this many expanded nodes
+ANYTIME_DIVE_INTERVAL = 16
+# Significant digits of an activity's quantity in a solution signature, the same activities summed in
+# another order only differ past this
+SIGNATURE_DIGITS = 9
 
 
-@dataclass
+@dataclass(slots=True)
 class ActivityQuant:
     activity: Activity
     quantity: float
 
+    def key(self):
+        return self.activity.id, canonicalQuantity(self.quantity)
+
     def __hash__(self):
-        return hash(self.activity)
+        return hash(self.key())
 
-    # Python does equality checks for hashes in dictionaries too (to mitigate collisions)
-    # So if I want to hash by activity AND str, this is needed
+    # Equal to another for the same activity and quantity, or to its activity's description
     def __eq__(self, other):
         if isinstance(other, str):
             return self.activity.description == other
-        else:
-            return super().__eq__(other)
+        elif isinstance(other, ActivityQuant):
+            return self.key() == other.key()
+        return NotImplemented
+
+
+def canonicalQuantity(x):
+    return float(f'{x:.{SIGNATURE_DIGITS}g}')
+
+
+def _activityQuantities(history) -> dict[int, float]:
+    # Activity id -> summed quantity over a Solution history, in the order activities were first added
+    sequence = []
+    while history is not None:
+        aq, history = history
+        sequence.append(aq)
+    quantities = {}
+    for aq in reversed(sequence):
+        quantities[aq.activity.id] = quantities.get(aq.activity.id, 0) + aq.quantity
+    return quantities
+
+
+def _signature(history) -> tuple:
+    # Canonical (activity id, quantity) pairs, equal for every order of adding the same activities
+    return tuple(sorted(
+        (activity_id, canonicalQuantity(quantity)) for activity_id, quantity in _activityQuantities(history).items()
+    ))
+
+
+class _SeenSolutions:
+    # Solutions with the same activities have the same total actions and open inputs (so the same lower bound),
+    # signatures are only worked out when two solutions agree on both.
+    # Keeps each solution's history (shared with its children), not the solution
+    def __init__(self):
+        # Rounded (actions, bound) -> a lone history, or the signatures of every solution with them
+        self._by_cost: dict[tuple[float, float], object] = {}
+
+    def add(self, soln, bound=0) -> bool:
+        # False if a solution with the same activities was added before
+        key = (round(soln.total_actions, SIGNATURE_DIGITS), round(bound, SIGNATURE_DIGITS))
+        if key not in self._by_cost:
+            self._by_cost[key] = soln._history
+            return True
+        same_cost = self._by_cost[key]
+        if not isinstance(same_cost, set):
+            same_cost = self._by_cost[key] = {_signature(same_cost)}
+        signature = soln.signature()
+        if signature in same_cost:
+            return False
+        same_cost.add(signature)
+        return True
 
 
 def toClosestInt(x):
@@ -69,55 +146,184 @@ def toClosestInt(x):
 
 
 def bold(s):
+    # Formatting libraries are only loaded for table output, machine-readable output never needs them
+    from termcolor import colored
     return colored(s, attrs=['bold'])
 
 
 class Solution:
     # An ordered ActivityGroup (stack order)
-    def __init__(self, activity_sequence: list[ActivityQuant] = None):
-        if activity_sequence is None:
-            activity_sequence = []
-        self.activity_sequence = activity_sequence
+    # The sequence is kept as a persistent linked list of (ActivityQuant, rest) cells, newest first,
+    # so branches share their parent's history instead of copying it
+    __slots__ = (
+        '_history', '_length', 'total_actions', 'total_inputs', 'total_outputs',
+        'sale_value', 'sell_prices', 'have', 'stock', 'sells', 'lower_bound', 'discarded',
+    )
+
+    def __init__(
+        self, activity_sequence: list[ActivityQuant] = None, sell_prices: dict[str, float] = None, have: dict[str, float] = None
+    ):
+        self._history = None
+        self._length = 0
         self.total_actions = 0
         self.total_inputs = Counter()
         self.total_outputs = Counter()
-        self._populateTotals()
+        # Echoes the current leftovers would fetch at the bazaar, kept up to date as activities are added
+        self.sale_value = 0
+        self.sell_prices = sell_prices if sell_prices is not None else {}
+        # The player's starting inventory and what is left of it, inputs draw on it before staying open
+        self.have = have if have is not None else {}
+        self.stock = Counter({item: quantity for item, quantity in self.have.items() if quantity > 0})
+        # (quantity, item, echo value) for each leftover sold at the bazaar
+        self.sells = []
+        # Set when a search ran out of budget: the optimal solution's net actions are at least this
+        self.lower_bound = None
+        # Set by beam mode: branches it dropped on the way, none of which were ever looked at further
+        self.discarded = None
+        if activity_sequence is not None:
+            for aq in activity_sequence:
+                self.addActivity(aq)
     
     def __repr__(self):
         return f'Solution({self.activity_sequence=})'
 
-    def _populateTotals(self):
-        self.total_actions = 0
-        self.total_inputs = Counter()
-        self.total_outputs = Counter()
+    def __len__(self):
+        return self._length
+
+    @property
+    def activity_sequence(self) -> list[ActivityQuant]:
+        sequence = []
+        node = self._history
+        while node is not None:
+            aq, node = node
+            sequence.append(aq)
+        sequence.reverse()
+        return sequence
+
+    @activity_sequence.setter
+    def activity_sequence(self, activity_sequence: list[ActivityQuant]):
+        # Only reorders/regroups the history, totals are left as they are
+        self._history = None
+        self._length = 0
+        for aq in activity_sequence:
+            self._history = (aq, self._history)
+            self._length += 1
+
+    def branch(self):
+        # Child shares the history and gets its own copy of the totals
+        child = Solution.__new__(Solution)
+        child._history = self._history
+        child._length = self._length
+        child.total_actions = self.total_actions
+        child.total_inputs = self.total_inputs.copy()
+        child.total_outputs = self.total_outputs.copy()
+        child.sale_value = self.sale_value
+        child.sell_prices = self.sell_prices
+        child.have = self.have
+        # Entries are only ever removed from stock, so an empty one can be shared
+        child.stock = self.stock.copy() if self.stock else self.stock
+        child.sells = []
+        child.lower_bound = None
+        child.discarded = None
+        return child
+
+    def restart(self):
+        # Empty solution drawing on what is left of this one's stock, the root's children start from this
+        soln = Solution(sell_prices=self.sell_prices)
+        soln.have = self.have
+        soln.stock = self.stock.copy()
+        return soln
 
-        for aq in self.activity_sequence:
-            self.total_actions += aq.activity.actions * aq.quantity
-            for inp, inp_quantity in aq.activity.inputs.items():
-                self.total_inputs[inp] = self.total_inputs[inp] + inp_quantity * aq.quantity
-            for out, out_quantity in aq.activity.outputs.items():
-                self.total_outputs[out] = self.total_outputs[out] + out_quantity * aq.quantity
-        
-        # Merge inputs and outputs
-        # TODO: Optimize away this merge
-        input_deletion_keys = []
-        for k in self.total_inputs:
-            if k in self.total_outputs:
-                output_quant = self.total_outputs[k]
-                if self.total_inputs[k] > output_quant:
-                    self.total_inputs[k] = self.total_inputs[k] - output_quant
-                    del self.total_outputs[k]
-                else:
-                    input_deletion_keys.append(k)
-                    self.total_outputs[k] = self.total_outputs[k] - self.total_inputs[k]
-        for dk in input_deletion_keys:
-            del self.total_inputs[dk]
+    def _addInput(self, item, quantity):
+        # Inputs and outputs are kept merged, an item is only ever on one side
+        # Produced leftovers are used first, then stock, and only the rest is left open
+        if item in self.total_outputs:
+            output_quant = self.total_outputs[item]
+            if item in self.sell_prices:
+                # Leftovers used up here can't be sold any more
+                self.sale_value -= self.sell_prices[item] * min(quantity, output_quant)
+            if quantity <= output_quant:
+                self.total_outputs[item] = output_quant - quantity
+                return
+            del self.total_outputs[item]
+            quantity -= output_quant
+        if item in self.stock:
+            stock_quant = self.stock[item]
+            if quantity < stock_quant:
+                self.stock[item] = stock_quant - quantity
+                return
+            del self.stock[item]
+            quantity -= stock_quant
+            if quantity <= 0:
+                return
+        self.total_inputs[item] = self.total_inputs[item] + quantity
+
+    def _addOutput(self, item, quantity):
+        if item in self.total_inputs:
+            input_quant = self.total_inputs[item]
+            if input_quant > quantity:
+                self.total_inputs[item] = input_quant - quantity
+                return
+            del self.total_inputs[item]
+            leftover = quantity - input_quant
+            self.total_outputs[item] = leftover
+        else:
+            leftover = quantity
+            self.total_outputs[item] = self.total_outputs[item] + quantity
+        if item in self.sell_prices:
+            self.sale_value += self.sell_prices[item] * leftover
+
+    def activityQuantities(self) -> dict[int, float]:
+        return _activityQuantities(self._history)
+
+    def signature(self) -> tuple:
+        # Any sequence with the same summed quantities ends with the same totals, so this is what the solution really is
+        return _signature(self._history)
 
     def addActivity(self, aq: ActivityQuant):
-        self.activity_sequence.append(aq)
-        self._populateTotals() # TODO: Optimization
+        self._history = (aq, self._history)
+        self._length += 1
+        activity, quantity = aq.activity, aq.quantity
+
+        self.total_actions += activity.actions * quantity
+        for inp, inp_quantity in activity.inputs.items():
+            self._addInput(inp, inp_quantity * quantity)
+        for out, out_quantity in activity.outputs.items():
+            self._addOutput(out, out_quantity * quantity)
     
-    def pprint(self, sells=None):
+    def usedStock(self) -> dict[str, float]:
+        return {
+            item: quantity - self.stock.get(item, 0)
+            for item, quantity in self.have.items()
+            if quantity - self.stock.get(item, 0) > RESIDUE
+        }
+
+    def netActions(self, cost):
+        # Actions net of the leftovers' sale value, with echoes converted at cost['echoes'] actions each
+        return cost.get('action', 1) * self.total_actions - cost.get('echoes', 0) * self.sale_value
+
+    def toDict(self):
+        return {
+            'actions': float(self.total_actions),
+            'sequence': [
+                {'activity': aq.activity.description, 'quantity': float(aq.quantity)}
+                for aq in self.activity_sequence
+            ],
+            'inputs': {k: float(v) for k, v in self.total_inputs.items() if abs(v) > RESIDUE},
+            'outputs': {k: float(v) for k, v in self.total_outputs.items() if abs(v) > RESIDUE},
+            'sold': [
+                {'item': item, 'quantity': float(iquant), 'echoes': float(echo_value)}
+                for iquant, item, echo_value in self.sells
+            ],
+            'from_inventory': {k: float(v) for k, v in self.usedStock().items()},
+            **({'lower_bound': float(self.lower_bound)} if self.lower_bound is not None else {}),
+            **({'discarded': self.discarded} if self.discarded is not None else {}),
+        }
+
+    def pprint(self, file=None):
+        from tabulate import tabulate
+        from termcolor import colored
+
         # Combine inputs and outputs into single dict
         inverted_inputs = {k:-v for k,v in self.total_inputs.items()}
         combined = deepcopy(self.total_outputs)
@@ -131,10 +337,14 @@ class Solution:
         for dk in deletion_keys:
             del combined[dk]
 
-        print(f'{bold("Actions:")} {round(toClosestInt(self.total_actions), 2)}')
-        print(bold('Sequence:'))
+        print(f'{bold("Actions:")} {round(toClosestInt(self.total_actions), 2)}', file=file)
+        if self.lower_bound is not None:
+            print(f'{bold("Best possible:")} {round(toClosestInt(self.lower_bound), 2)} (search stopped early)', file=file)
+        if self.discarded is not None:
+            print(f'{bold("Discarded branches:")} {self.discarded} (beam search)', file=file)
+        print(bold('Sequence:'), file=file)
         for aq in self.activity_sequence[::-1]:
-            print(f'   {round(toClosestInt(aq.quantity), 2)}x {aq.activity.description}')
+            print(f'   {round(toClosestInt(aq.quantity), 2)}x {aq.activity.description}', file=file)
         print(tabulate(
             [
                 (
@@ -146,99 +356,884 @@ class Solution:
             ],
             headers=[bold('Item'), bold('Quantity')],
             tablefmt='fancy_grid'
-        ))
+        ), file=file)
+
+        used_stock = self.usedStock()
+        if used_stock != {}:
+            print(bold('From inventory:'), file=file)
+            for item, iquant in used_stock.items():
+                print(f'   {round(toClosestInt(iquant), 2)}x {item}', file=file)
+
+        if self.sells != []:
+            print(bold('Sold:'), file=file)
+            for iquant, item, echo_value in self.sells:
+                print(f'   {round(toClosestInt(iquant), 2)}x {item} for {round(toClosestInt(echo_value), 2)} echoes', file=file)
+
 
-        if sells is not None and sells != []:
-            print(bold('Sold:'))
-            for iquant, item, echo_value in sells:
-                print(f'   {round(toClosestInt(iquant), 2)}x {item} for {round(toClosestInt(echo_value), 2)} echoes')
+def _producerGroups(tree, soln):
+    # Find all possible producers for each input, inputs nothing produces are left open
+    groups = []
+    for want_ingredient, want_quantity in soln.total_inputs.items():
+        if want_ingredient == 'echoes' or want_quantity <= RESIDUE:
+            continue
+        producers = [
+            ActivityQuant(activity, want_quantity / activity.outputs[want_ingredient])
+            for activity in tree._output_index[want_ingredient]
+        ]
+        if producers != []:
+            groups.append(producers)
+    return groups
 
 
-def solve(have, intent, cost):
-    tree = GameTree()
+def _searchWeights(cost=None):
+    # (actions per action, actions per echo of sale value) the search ranks by, the same as _finishSolutions does
+    if cost is None:
+        cost = COST
+    return cost.get('action', 1), cost.get('echoes', 0) if TRY_TO_SELL_OUTPUTS else 0
 
+
+class _SearchCosts:
+    # Net actions (see Solution.netActions) of solutions, activities and items for one catalog and pair of weights
+    def __init__(self, tree, weights):
+        self.action_weight, self.echo_weight = weights
+        # Each activity's own net cost per run: its actions less what all its outputs would sell for
+        self.activity = [
+            self.action_weight * activity.actions
+            - self.echo_weight * sum(tree.sell_prices.get(out, 0) * quantity for out, quantity in activity.outputs.items())
+            for activity in tree.activities
+        ]
+        producers = {item: producers for item, producers in tree._output_index.items() if producers != []}
+        if self.echo_weight == 0:
+            # Fewest actions per unit over each item's direct producers
+            self.per_unit = {
+                item: min(self.action_weight * activity.actions / activity.outputs[item] for activity in producers)
+                for item, producers in producers.items()
+            }
+            self.estimate_per_unit = self.per_unit
+        else:
+            self.per_unit = self._netPerUnit(tree, producers)
+            # A loop with no bound would make every estimate through it -inf, estimates fall back to one step
+            first_step = self._netPerUnit(tree, producers, passes=1)
+            self.estimate_per_unit = {
+                item: value if value > -math.inf else first_step[item] for item, value in self.per_unit.items()
+            }
+
+    def _netPerUnit(self, tree, producers, passes=None):
+        # Least net actions per unit of each item over its direct producers: the producer's own net cost, but for the
+        # sale value of the item it's run for (all of that is wanted), plus its inputs wherever producing them is
+        # worth a credit. A fixed point of that can't overestimate any way of making the item. Leftovers sold along
+        # a loop of producers can pay for more than the loop costs, items the loop reaches are left unbounded (-inf)
+        producers = {item: group for item, group in producers.items() if item != 'echoes'}
+        if passes is None:
+            passes = len(producers) + 1
+        per_unit = {}
+        for _ in range(passes):
+            changed = []
+            for item, group in producers.items():
+                value = min(
+                    (
+                        self.activity[activity.id]
+                        + self.echo_weight * tree.sell_prices.get(item, 0) * activity.outputs[item]
+                        + sum(
+                            min(0, per_unit.get(inp, 0)) * inp_quantity
+                            for inp, inp_quantity in activity.inputs.items()
+                            if inp_quantity > 0
+                        )
+                    ) / activity.outputs[item]
+                    for activity in group
+                )
+                if item not in per_unit or value < per_unit[item]:
+                    per_unit[item] = value
+                    changed.append(item)
+            if changed == []:
+                break
+        else:
+            if passes > 1:
+                for item in changed:
+                    per_unit[item] = -math.inf
+                # Everything made from those is unbounded too
+                while changed != []:
+                    changed = [
+                        item for item, group in producers.items()
+                        if per_unit[item] > -math.inf and any(
+                            per_unit.get(inp, 0) == -math.inf for activity in group for inp in activity.inputs
+                        )
+                    ]
+                    for item in changed:
+                        per_unit[item] = -math.inf
+        per_unit['echoes'] = 0
+        return per_unit
+
+    def net(self, soln):
+        return self.action_weight * soln.total_actions - self.echo_weight * soln.sale_value
+
+
+_SEARCH_COSTS_CACHE: dict[tuple, _SearchCosts] = {}
+
+
+def _searchCosts(tree, weights=(1, 0)):
+    # Once per catalog and weights
+    key = (tree.fingerprint(), weights)
+    if key not in _SEARCH_COSTS_CACHE:
+        _SEARCH_COSTS_CACHE[key] = _SearchCosts(tree, weights)
+    return _SEARCH_COSTS_CACHE[key]
+
+
+def _lowerBound(per_unit, soln):
+    # Best-first on (net actions so far + lower bound on the net actions still needed).
+    # Every open input with a producer gets one picked for its full quantity in the next
+    # expansion, so the least net actions per unit over its producers can't overestimate.
+    return sum(
+        per_unit[item] * quantity
+        for item, quantity in soln.total_inputs.items()
+        if item in per_unit and item != 'echoes'
+    )
+
+
+def _expand(tree, soln, profile=None):
+    # Children of a partial solution, one per combination of producers for its open inputs
+    # Yields nothing once no open input has a producer
+    groups = _producerGroups(tree, soln)
+    if groups == []:
+        return
+    if profile is not None:
+        profile.fanOut(math.prod(len(group) for group in groups))
+
+    for action_set in itertools.product(*groups):
+        yield _child(soln, action_set, profile)
+
+
+def _child(soln, action_set, profile=None):
+    # The root only carries the intent, its children start from an empty inventory
+    if profile is None:
+        new_soln = soln.branch() if len(soln) > 0 else soln.restart()
+        for aq in action_set:
+            new_soln.addActivity(aq)
+        return new_soln
+
+    start = time.perf_counter()
+    new_soln = soln.branch() if len(soln) > 0 else soln.restart()
+    branched = time.perf_counter()
+    for aq in action_set:
+        new_soln.addActivity(aq)
+    profile.addTime('branch', branched - start)
+    profile.addTime('addActivity', time.perf_counter() - branched)
+    return new_soln
+
+
+def _producerEstimate(costs, aq):
+    # Net actions of aq plus the cheapest direct way to make its inputs
+    per_unit = costs.estimate_per_unit
+    return aq.quantity * (
+        costs.activity[aq.activity.id]
+        + sum(per_unit.get(inp, 0) * inp_quantity for inp, inp_quantity in aq.activity.inputs.items())
+    )
+
+
+def _cheapestCombinations(groups, estimate, limit):
+    # Up to limit producer combinations in order of increasing summed estimate (k-best over a product
+    # of sorted lists), so a node with many open inputs doesn't enumerate its whole cartesian product
+    ranked = [sorted(group, key=estimate) for group in groups]
+    costs = [[estimate(aq) for aq in group] for group in ranked]
+    start = (0,) * len(ranked)
+    candidates = [(sum(group_costs[0] for group_costs in costs), start)]
+    seen = {start}
+    while len(candidates) > 0 and limit > 0:
+        cost, idxs = heapq.heappop(candidates)
+        yield cost, tuple(ranked[g][i] for g, i in enumerate(idxs))
+        limit -= 1
+        for g, i in enumerate(idxs):
+            if i + 1 < len(ranked[g]):
+                next_idxs = idxs[:g] + (i + 1,) + idxs[g + 1:]
+                if next_idxs not in seen:
+                    seen.add(next_idxs)
+                    heapq.heappush(candidates, (cost - costs[g][i] + costs[g][i + 1], next_idxs))
+
+
+def _rootSolution(tree, intent, have=None):
+    # Open inputs are whatever of the intent the stock doesn't already cover
+    root = Solution(sell_prices=tree.sell_prices, have=have)
+    for item, quantity in intent.items():
+        root._addInput(item, quantity)
+    return root
+
+
+def _replay(root, sequence):
+    # Complete solution from a root and the activities picked for it, or the root itself if none were
+    if sequence == []:
+        return root
+    soln = root.restart()
+    for aq in sequence:
+        soln.addActivity(aq)
+    return soln
+
+
+def _bestFirst(tree, curr_solutions, keep, profile=None, incumbents=None, weights=(1, 0)):
+    # Pops (priority, path, solution) entries until keep complete solutions are proven
+    # Ties are broken by the branch index path, so the order doesn't depend on push order
+    # Other expansion orders reach the same activities, those are dropped as they come up
+    # With _SharedIncumbents, also stops once nothing left here can beat the keep found by every search sharing them
+    costs = _searchCosts(tree, weights)
+    heapq.heapify(curr_solutions)
+    seen = _SeenSolutions()
+    for _, _, soln in curr_solutions:
+        seen.add(soln, _lowerBound(costs.per_unit, soln))
+    finished_solutions = []
+    while len(curr_solutions) > 0 and len(finished_solutions) < keep:
+        if incumbents is not None and curr_solutions[0][0] > incumbents.bound():
+            break
+        _, path, soln = heapq.heappop(curr_solutions)
+        if profile is not None:
+            profile.expanded(len(curr_solutions))
+
+        is_finished = True
+        for idx, new_soln in enumerate(_expand(tree, soln, profile)):
+            is_finished = False
+            if len(path) >= MAX_SEARCH_DEPTH:
+                break
+            bound = _lowerBound(costs.per_unit, new_soln)
+            if not seen.add(new_soln, bound):
+                if profile is not None:
+                    profile.count('duplicates')
+                continue
+            heapq.heappush(curr_solutions, (costs.net(new_soln) + bound, path + (idx,), new_soln))
+        if is_finished:
+            # No possible producers left, and nothing left in the queue can finish cheaper
+            finished_solutions.append((path, soln))
+            if incumbents is not None:
+                incumbents.add(costs.net(soln))
+
+    return finished_solutions
+
+
+def _solveSearch(tree, intent, keep, have=None, profile=None, weights=(1, 0)):
     # Always use cartesian product merges instead of BFS
     # This way it is picking an entire set of actions instead of just one
     # As long as there are no cycles, this should work
-    curr_solutions = deque([(Solution(), 1)])
-    curr_solutions[0][0].total_inputs.update(INTENT)
-    finished_solutions = []
-    while len(curr_solutions) > 0:
-        soln, _ = curr_solutions.popleft()
+    root = _rootSolution(tree, intent, have)
+    return [soln for _, soln in _bestFirst(tree, [(0, (), root)], keep, profile, weights=weights)]
+
+
+def _solveBeam(tree, intent, keep, width, have=None, profile=None, weights=(1, 0)):
+    # Level by level, keeping only the width best (net actions + lower bound) partial solutions
+    # Both the beam and the finished list are bounded heaps, so memory doesn't grow with branching
+    costs = _searchCosts(tree, weights)
+    root = _rootSolution(tree, intent, have)
+
+    def estimate(aq):
+        return _producerEstimate(costs, aq)
 
-        # Find all possible producers for each input
-        base_activity_groups = {}
-        for want_ingredient, want_quantity in soln.total_inputs.items():
-            if want_ingredient == 'echoes':
+    curr_solutions = [root]
+    finished_solutions = []  # Max-heap on net actions of the best keep found
+    discarded = 0
+    duplicates = 0
+    order = itertools.count()
+    depth = 0
+    while len(curr_solutions) > 0 and depth < MAX_SEARCH_DEPTH:
+        depth += 1
+        next_solutions = []  # Max-heap on score, worst popped first
+        # Only this level's children are compared, so what's held stays bounded by the beam, not the depth
+        seen = _SeenSolutions()
+        for soln in curr_solutions:
+            if profile is not None:
+                profile.expanded(len(curr_solutions))
+            groups = _producerGroups(tree, soln)
+            if groups == []:
+                heapq.heappush(finished_solutions, (-costs.net(soln), -next(order), soln))
+                if len(finished_solutions) > keep:
+                    heapq.heappop(finished_solutions)
                 continue
-            base_activity_groups[want_ingredient] = []
 
-            for activity in tree._output_index[want_ingredient]:
-                aq = ActivityQuant(activity, want_quantity / activity.outputs[want_ingredient])
-                base_activity_groups[want_ingredient].append(aq)
+            # Only the width cheapest-looking combinations could make it into the beam anyway
+            combinations = math.prod(len(group) for group in groups)
+            discarded += max(0, combinations - width)
+            if profile is not None:
+                profile.fanOut(combinations)
+            for generated, (estimated_cost, action_set) in enumerate(_cheapestCombinations(groups, estimate, width)):
+                if len(next_solutions) == width and costs.net(soln) + estimated_cost >= -next_solutions[0][0]:
+                    # Combinations come cheapest first, the rest of this node's won't make the beam either
+                    discarded += min(combinations, width) - generated
+                    break
+                new_soln = _child(soln, action_set, profile)
+                bound = _lowerBound(costs.per_unit, new_soln)
+                if not seen.add(new_soln, bound):
+                    duplicates += 1
+                    continue
+                score = costs.net(new_soln) + bound
+                if len(finished_solutions) == keep and score >= -finished_solutions[0][0]:
+                    # Can't beat any of the keep already found
+                    discarded += 1
+                    continue
+                heapq.heappush(next_solutions, (-score, -next(order), new_soln))
+                if len(next_solutions) > width:
+                    heapq.heappop(next_solutions)
+                    discarded += 1
+        curr_solutions = [soln for _, _, soln in sorted(next_solutions, reverse=True)]
+
+    if profile is not None:
+        profile.count('discarded', discarded)
+        profile.count('duplicates', duplicates)
+    solutions = [soln for _, _, soln in sorted(finished_solutions, reverse=True)]
+    for soln in solutions:
+        soln.discarded = discarded
+    return solutions
+
+
+def _greedyDive(tree, soln, costs, depth=0):
+    # Complete solution from soln, taking the cheapest-looking producer for every open input at each step,
+    # or None if that never closes within MAX_SEARCH_DEPTH
+    def estimate(aq):
+        return _producerEstimate(costs, aq)
+
+    while depth < MAX_SEARCH_DEPTH:
+        groups = _producerGroups(tree, soln)
+        if groups == []:
+            return soln
+        _, action_set = next(_cheapestCombinations(groups, estimate, 1))
+        soln = _child(soln, action_set)
+        depth += 1
+    return None
 
-        all_action_sets = list(itertools.product(*[
-            base_activity_groups[want_ingredient] for want_ingredient in base_activity_groups
-            if base_activity_groups[want_ingredient] != []
-        ]))
 
-        if all_action_sets == [()]:
-            # No possible producers left
+def _solveAnytime(tree, intent, keep, time_limit=None, node_limit=None, have=None, profile=None, weights=(1, 0)):
+    # _solveSearch that stops after time_limit seconds or node_limit expansions. Complete solutions come early
+    # from greedy dives (from the root, then every ANYTIME_DIVE_INTERVAL expansions) and the cheapest-recipe plan,
+    # and are replaced by what the search proves as it goes. If the budget runs out first, every returned
+    # solution has lower_bound set: the least net actions of any solution the search could still find
+    deadline = time.perf_counter() + time_limit if time_limit is not None else math.inf
+    if node_limit is None:
+        node_limit = math.inf
+    costs = _searchCosts(tree, weights)
+    root = _rootSolution(tree, intent, have)
+
+    with _phase(profile, 'greedy'):
+        incumbents = [
+            soln for soln in (_greedyDive(tree, root, costs), *_solveTable(tree, intent, have))
+            if soln is not None
+        ]
+    # Same best-first order as _bestFirst, so an unexhausted budget gives exactly the search's answer
+    curr_solutions = [(_lowerBound(costs.per_unit, root), (), root)]
+    seen = _SeenSolutions()
+    seen.add(root, curr_solutions[0][0])
+    finished_solutions = []
+    expanded = 0
+    # Priority of a node whose expansion the deadline cut short, its missing children can't cost less
+    cut_short = math.inf
+    while len(curr_solutions) > 0 and len(finished_solutions) < keep and cut_short == math.inf:
+        if expanded >= node_limit or time.perf_counter() >= deadline:
+            break
+        priority, path, soln = heapq.heappop(curr_solutions)
+        expanded += 1
+        if profile is not None:
+            profile.expanded(len(curr_solutions))
+        if expanded % ANYTIME_DIVE_INTERVAL == 0:
+            dived = _greedyDive(tree, soln, costs, len(path))
+            if dived is not None:
+                incumbents.append(dived)
+
+        is_finished = True
+        for idx, new_soln in enumerate(_expand(tree, soln, profile)):
+            is_finished = False
+            if len(path) >= MAX_SEARCH_DEPTH:
+                break
+            if time.perf_counter() >= deadline:
+                # One expansion can be a big product of producer choices
+                cut_short = priority
+                break
+            bound = _lowerBound(costs.per_unit, new_soln)
+            if not seen.add(new_soln, bound):
+                continue
+            heapq.heappush(curr_solutions, (costs.net(new_soln) + bound, path + (idx,), new_soln))
+        if is_finished:
             finished_solutions.append(soln)
-        else:
-            for action_set in all_action_sets:
-                new_soln = deepcopy(soln)
-                for aq in action_set:
-                    new_soln.addActivity(aq)
-                curr_solutions.append((new_soln, 1))
 
+    if len(finished_solutions) == keep or (len(curr_solutions) == 0 and cut_short == math.inf):
+        return finished_solutions
+    # Out of budget: everything still queued costs at least its priority, and the first finished one is optimal
+    lower_bound = min(curr_solutions[0][0] if len(curr_solutions) > 0 else math.inf, cut_short)
+    if finished_solutions != []:
+        lower_bound = min(lower_bound, costs.net(finished_solutions[0]))
+    if profile is not None:
+        profile.count('budget_expansions', expanded)
+    solutions = _distinct(sorted(finished_solutions + incumbents, key=costs.net))[:keep]
+    for soln in solutions:
+        soln.lower_bound = min(lower_bound, costs.net(soln))
+    return solutions
+
+
+# Parallel search: the root's children are dealt out to one share per worker process, each of which runs the
+# same best-first search over its share. Nodes cross the process boundary as (path, [(activity id, quantity)])
+# and are replayed onto the root, so stock is drawn on the same way in every process.
+# Every share runs at once and they all publish what they finish to one _SharedIncumbents, so a share stops as
+# soon as the others have proven keep solutions cheaper than anything it has left, like the serial search would
+_WORKER_TREE = None
+_WORKER_INCUMBENTS = None
+
+
+class _SharedIncumbents:
+    # Net actions of the keep cheapest solutions finished by any process so far, ascending, in shared memory
+    def __init__(self, keep):
+        import multiprocessing
+        self._costs = multiprocessing.Array('d', [math.inf] * keep)
+
+    def bound(self):
+        # Read without the lock, a stale value only means stopping a little later
+        return self._costs.get_obj()[-1]
+
+    def add(self, cost):
+        with self._costs.get_lock():
+            costs = self._costs.get_obj()
+            if cost >= costs[-1]:
+                return
+            i = len(costs) - 1
+            while i > 0 and costs[i - 1] > cost:
+                costs[i] = costs[i - 1]
+                i -= 1
+            costs[i] = cost
+
+
+def _initWorker(tree, incumbents):
+    global _WORKER_TREE, _WORKER_INCUMBENTS
+    _WORKER_TREE = tree
+    _WORKER_INCUMBENTS = incumbents
+
+
+def _compactNode(path, soln):
+    return path, [(aq.activity.id, aq.quantity) for aq in soln.activity_sequence]
+
+
+def _expandCompactNode(tree, root, node):
+    path, sequence = node
+    return path, _replay(root, [ActivityQuant(tree.activities[activity_id], quantity) for activity_id, quantity in sequence])
+
+
+def _searchPartition(nodes, root, keep, profiled, weights):
+    tree = _WORKER_TREE
+    profile = Profile() if profiled else None
+    costs = _searchCosts(tree, weights)
+    curr_solutions = []
+    for node in nodes:
+        path, soln = _expandCompactNode(tree, root, node)
+        curr_solutions.append((costs.net(soln) + _lowerBound(costs.per_unit, soln), path, soln))
+    finished = [
+        _compactNode(path, soln)
+        for path, soln in _bestFirst(tree, curr_solutions, keep, profile, _WORKER_INCUMBENTS, weights)
+    ]
+    return finished, profile.toDict() if profile is not None else None
+
+
+def _solveSearchParallel(tree, intent, keep, workers, have=None, profile=None, weights=(1, 0)):
+    root = _rootSolution(tree, intent, have)
+    if profile is not None:
+        profile.expanded(0)
+    children = [_compactNode((idx,), soln) for idx, soln in enumerate(_expand(tree, root, profile))]
+    if children == []:
+        return [root]
+
+    # Exactly one share per worker: a share queued behind another would never get to lower the shared bound,
+    # and the running one could search a cycle-heavy subtree for ever waiting on it
+    share_count = min(len(children), workers)
+    shares = [children[i::share_count] for i in range(share_count)]
+    incumbents = _SharedIncumbents(keep)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=share_count, initializer=_initWorker, initargs=(tree, incumbents)) as pool:
+        results = pool.map(
+            _searchPartition, shares, itertools.repeat(root), itertools.repeat(keep), itertools.repeat(profile is not None),
+            itertools.repeat(weights),
+        )
+        finished = []
+        for share_finished, share_profile in results:
+            finished.extend(_expandCompactNode(tree, root, node) for node in share_finished)
+            if share_profile is not None:
+                profile.merge(share_profile)
+
+    # A share only stops early once everything it has left costs more than the keep best found overall,
+    # so those are all in here, and sorting matches the serial (net actions, path) order
+    # Shares only drop their own duplicates, the same activities can still finish in two of them
+    costs = _searchCosts(tree, weights)
+    finished.sort(key=lambda x: (costs.net(x[1]), x[0]))
+    return _distinct([soln for _, soln in finished])[:keep]
+
+
+def _distinct(solutions):
+    # First of the solutions with each signature, in order
+    seen = _SeenSolutions()
+    return [soln for soln in solutions if seen.add(soln)]
+
+
+def _solveLP(tree, intent, have=None):
+    # Every activity is linear, so pick activity quantities x >= 0 minimising total actions
+    # subject to (net production of item) >= (wanted quantity - stock) for every producible item.
+    # Items nothing produces (and echoes) are left as inputs, same as the search.
+    root = _rootSolution(tree, intent, have)
+
+    # Only consider activities reachable from the intent, in the order the search would add them
+    activities: list[Activity] = []
+    seen_activities = set()
+    items = []
+    seen_items = set()
+    frontier = deque(intent)
+    while len(frontier) > 0:
+        item = frontier.popleft()
+        if item in seen_items or item == 'echoes':
+            continue
+        seen_items.add(item)
+        if tree._output_index[item] != []:
+            items.append(item)
+        for activity in tree._output_index[item]:
+            if activity.description not in seen_activities:
+                seen_activities.add(activity.description)
+                activities.append(activity)
+                frontier.extend(activity.inputs)
+
+    costs = [activity.actions + LP_TIEBREAK for activity in activities]
+    rows = [
+        [
+            activity.outputs.get(item, 0) - activity.inputs.get(item, 0)
+            for activity in activities
+        ]
+        for item in items
+    ]
+    rhs = [root.total_inputs.get(item, 0) - root.stock.get(item, 0) for item in items]
+
+    quantities = minimize(costs, rows, rhs)
+    if quantities is None:
+        return []
+
+    return [_replay(root, [
+        ActivityQuant(activity, quantity)
+        for activity, quantity in zip(activities, quantities)
+        if quantity > TOLERANCE * TOLERANCE
+    ])]
+
+
+def _solveTable(tree, intent, have=None):
+    # Scale the memoised cheapest per-unit recipes, no search at all
+    root = _rootSolution(tree, intent, have)
+    plan = getUnitCostTable(tree).plan(root.total_inputs, root.stock)
+    return [_replay(root, [ActivityQuant(activity, quantity) for activity, quantity in plan])]
+
+
+def _findSolutions(
+    tree, intent, mode, keep, workers=None, beam_width=BEAM_WIDTH, profile=None, have=None, time_limit=None, node_limit=None,
+    cost=None,
+):
+    # The searches rank by cost's net actions, so the keep they prove are the keep _finishSolutions ranks first.
+    # Where selling leftovers along some loop pays for more than the loop costs there's no bound to stop on,
+    # give those a time or node budget. lp and table minimise actions alone
+    weights = _searchWeights(cost)
+    if time_limit is not None or node_limit is not None:
+        if mode != 'search' or (workers is not None and workers > 1):
+            raise ValueError('A time or node budget only applies to the serial search')
+        return _solveAnytime(tree, intent, keep, time_limit, node_limit, have, profile, weights)
+    elif mode == 'search' and workers is not None and workers > 1:
+        return _solveSearchParallel(tree, intent, keep, workers, have, profile, weights)
+    elif mode == 'search':
+        return _solveSearch(tree, intent, keep, have, profile, weights)
+    elif mode == 'beam':
+        return _solveBeam(tree, intent, keep, beam_width, have, profile, weights)
+    elif mode == 'lp':
+        return _solveLP(tree, intent, have)
+    elif mode == 'table':
+        return _solveTable(tree, intent, have)
+    else:
+        raise ValueError(f'Unknown solve mode {mode!r}')
+
+
+def _finishSolutions(tree, finished_solutions, keep, cost=None, profile=None):
+    if cost is None:
+        cost = COST
     if TRY_TO_SELL_OUTPUTS:
-        # Figure out activities that are item -> echoes only
-        bazaar_sells: dict[str, Activity] = {}
-        for activity in LIST_OF_ACTIVITIES:
-            if len(activity.outputs) == 1 and 'echoes' in activity.outputs:
-                bazaar_sells[list(activity.inputs)[0]] = activity
-
-        sell_solutions = []
-        for soln in finished_solutions:
-            sold_items = []
-            for out, out_quantity in soln.total_outputs.items():
-                if out in bazaar_sells:
-                    bazaar_activity = bazaar_sells[out]
-                    echo_value = out_quantity * (bazaar_activity.outputs['echoes'] / bazaar_activity.inputs[out])
-                    sold_items.append((out_quantity, out, echo_value))
-        
-            total_sell_value = 0
-            for iquant, item, echo_value in sold_items:
-                total_sell_value += echo_value
-                del soln.total_outputs[item]
-            soln.total_outputs['echoes'] += total_sell_value
-            sell_solutions.append(sold_items)
+        with _phase(profile, 'sell'):
+            # Leftovers were valued at the tree's best bazaar prices as activities were added (Solution.sale_value),
+            # so there's no second pass over the sequences here, just cash them in
+            for soln in finished_solutions:
+                for item, quantity in list(soln.total_outputs.items()):
+                    if item in soln.sell_prices and quantity > RESIDUE:
+                        soln.sells.append((quantity, item, quantity * soln.sell_prices[item]))
+                        del soln.total_outputs[item]
+                soln.total_outputs['echoes'] += soln.sale_value
+    else:
+        cost = {**cost, 'echoes': 0}
 
     if MERGE_SOLUTION_SEQUENCES:
-        # Prefer "first" activities in solution
-        for solution in finished_solutions:
-            locations = {}
-            repeats = 0
-            for idx, activity_quant in enumerate(solution.activity_sequence):
-                activity = activity_quant.activity
-                if activity.description in locations:
-                    repeats += 1
-                    # Merge the two
-                    solution.activity_sequence[locations[activity.description]].quantity += activity_quant.quantity
-                    solution.activity_sequence[idx] = None
-                else:
-                    locations[activity.description] = idx
-            solution.activity_sequence = [x for x in solution.activity_sequence if x is not None]
-
-    finished_solutions.sort(key=lambda x: x.total_actions)
-    finished_solutions = finished_solutions[:SOLUTIONS_TO_KEEP]
-
-    print(SOLUTION_BORDER)
-    for idx, solution in enumerate(finished_solutions):
-        solution.pprint(sells=sell_solutions[idx] if TRY_TO_SELL_OUTPUTS else None)
-        print(SOLUTION_BORDER)
+        with _phase(profile, 'merge'):
+            # Prefer "first" activities in solution, each with its summed quantity
+            for solution in finished_solutions:
+                activities = {aq.activity.id: aq.activity for aq in solution.activity_sequence}
+                solution.activity_sequence = [
+                    ActivityQuant(activities[activity_id], quantity)
+                    for activity_id, quantity in solution.activityQuantities().items()
+                ]
+
+    finished_solutions.sort(key=lambda x: x.netActions(cost))
+    return finished_solutions[:keep]
+
+
+def _phase(profile, name):
+    return profile.timed(name) if profile is not None else nullcontext()
+
+
+def _intentDirection(intent):
+    # Intents that are multiples of each other share a search, keyed on the normalised intent
+    items = sorted(intent)
+    if items == [] or intent[items[0]] == 0:
+        return tuple((item, intent[item]) for item in items), 1
+    scale = intent[items[0]]
+    return tuple((item, round(intent[item] / scale, 12)) for item in items), scale
+
+
+def _resultKey(tree, intent, have, mode, keep, beam_width, weights):
+    # Only the part of the catalog the query can reach goes in, so editing any other activity keeps the entry.
+    # Stats are covered by it too, the tree's activities are already resolved for them.
+    # Cost weights change which solutions the searches find, lp and table don't use them.
+    return canonicalKey(
+        RESULT_CACHE_VERSION, mode, keep, beam_width if mode == 'beam' else None, RESIDUE, MAX_SEARCH_DEPTH,
+        weights if mode in ('search', 'beam') else None,
+        sorted(intent.items()), sorted(have.items()),
+        tree.subsetFingerprint(list(intent) + list(have)),
+    )
+
+
+def _findSolutionsCached(tree, intent, have, mode, keep, workers, beam_width, cache, profile=None, cost=None):
+    # Unfinished solutions for intent, searching only when no equivalent query is cached.
+    # Echo stock never changes which producers are picked, so then the search is done without stock for the
+    # normalised intent and shared by every multiple of it. Other stock doesn't scale, so then only identical queries share.
+    if all(item == 'echoes' for item in have):
+        direction, scale = _intentDirection(intent)
+        search_intent, search_have = dict(direction), {}
+    else:
+        search_intent, search_have, scale = intent, have, 1
+
+    key = _resultKey(tree, search_intent, search_have, mode, keep, beam_width, _searchWeights(cost))
+    entries = cache.get(key)
+    if profile is not None:
+        profile.count('cache_hits' if entries is not None else 'cache_misses')
+    if entries is None:
+        found = _findSolutions(tree, search_intent, mode, keep, workers, beam_width, profile, search_have, cost=cost)
+        entries = [
+            {
+                'sequence': [(aq.activity.description, aq.quantity) for aq in soln.activity_sequence],
+                'discarded': soln.discarded,
+            }
+            for soln in found
+        ]
+        cache.put(key, entries)
+
+    # Replayed onto this query's own root, so stock is drawn on for the real quantities
+    solutions = []
+    for entry in entries:
+        soln = _replay(_rootSolution(tree, intent, have), [
+            ActivityQuant(tree.activities[tree.activity_ids[description]], quantity * scale)
+            for description, quantity in entry['sequence']
+        ])
+        soln.discarded = entry['discarded']
+        solutions.append(soln)
+    return solutions
+
+
+def solve(
+    have, intent, cost, mode='search', keep=SOLUTIONS_TO_KEEP, tree=None, workers=None, beam_width=BEAM_WIDTH, profile=None,
+    cache=None, time_limit=None, node_limit=None,
+) -> list[Solution]:
+    # workers > 1 spreads the search over that many processes, with the same results as serial
+    # Pass an instrument.Profile to get counters and per-phase timings back
+    # Pass a cache.ResultCache to reuse searches across calls
+    # time_limit (seconds) or node_limit (expansions) return the best found so far once spent, see _solveAnytime.
+    # Those results depend on the budget (and the machine), so they're never cached
+    if tree is None:
+        with _phase(profile, 'tree'):
+            tree = GameTree()
+    with _phase(profile, 'search'):
+        if cache is None or time_limit is not None or node_limit is not None:
+            finished_solutions = _findSolutions(
+                tree, intent, mode, keep, workers, beam_width, profile, have, time_limit, node_limit, cost,
+            )
+        else:
+            finished_solutions = _findSolutionsCached(
+                tree, intent, have, mode, keep, workers, beam_width, cache, profile, cost,
+            )
+    return _finishSolutions(tree, finished_solutions, keep, cost, profile)
+
+
+def solve_many(
+    intents: list[dict], have=None, cost=None, mode='search', keep=SOLUTIONS_TO_KEEP, tree=None, workers=None, beam_width=BEAM_WIDTH,
+    profile=None, cache=None, time_limit=None, node_limit=None,
+) -> list[list[Solution]]:
+    # One tree (and one set of per-catalog tables) for every query,
+    # and one search per distinct intent up to scaling (a budget applies to each intent's search on its own)
+    # Intents that only share a sub-chain are still searched separately: a search node is every open input at once,
+    # with leftovers cancelling across them, so there is no per-sub-intent result to reuse. What they do share is
+    # per item: the unit cost table (table mode's cheapest recipe for each item) and the search's lower bounds
+    if have is None:
+        have = HAVE
+    if cost is None:
+        cost = COST
+    if tree is None:
+        with _phase(profile, 'tree'):
+            tree = GameTree()
+    if cache is None:
+        cache = ResultCache()
+
+    results = []
+    for intent in intents:
+        with _phase(profile, 'search'):
+            if time_limit is not None or node_limit is not None:
+                finished_solutions = _findSolutions(
+                    tree, intent, mode, keep, workers, beam_width, profile, have, time_limit, node_limit, cost,
+                )
+            else:
+                finished_solutions = _findSolutionsCached(
+                    tree, intent, have, mode, keep, workers, beam_width, cache, profile, cost,
+                )
+        results.append(_finishSolutions(tree, finished_solutions, keep, cost, profile))
+    return results
+
+
+def sensitivity(
+    description, item=None, changes=SENSITIVITY_CHANGES, intent=None, have=None, cost=None, mode='table', tree=None,
+    cache=None,
+) -> list[tuple[float, float]]:
+    # (change, best net actions) with the activity's yield of item (every output when None) moved by each relative
+    # change, after (0, best net actions) as they are. Edited trees share everything the edit can't reach: in table
+    # mode only downstream item costs are recomputed, and with a cache other modes only search again when the
+    # intent actually depends on the activity
+    if intent is None:
+        intent = INTENT
+    if have is None:
+        have = HAVE
+    if cost is None:
+        cost = COST
+    if tree is None:
+        tree = GameTree()
+    if cache is None:
+        cache = ResultCache()
+    activity = tree.findActivity(description)
+    if item is not None and item not in activity.outputs:
+        raise KeyError(f'{description!r} does not make {item!r}')
+
+    def best(edited):
+        solutions = solve(have, intent, cost, mode=mode, keep=1, tree=edited, cache=cache)
+        return solutions[0].netActions(cost) if solutions != [] else math.inf
+
+    rows = [(0, best(tree))]
+    reached = {a.id for a in tree.upstreamActivities(list(intent) + list(have))}
+    for change in changes:
+        if activity.id not in reached:
+            # Nothing the intent needs goes through it
+            rows.append((change, rows[0][1]))
+            continue
+        edited = tree.withActivity(Activity(
+            description=activity.description,
+            actions=activity.actions,
+            inputs=dict(activity.inputs),
+            outputs={
+                out: quantity * (1 + change) if item is None or out == item else quantity
+                for out, quantity in activity.outputs.items()
+            },
+        ))
+        rows.append((change, best(edited)))
+    return rows
+
+
+def printSolutions(solutions: list[Solution], file=None):
+    print(SOLUTION_BORDER, file=file)
+    for solution in solutions:
+        solution.pprint(file)
+        print(SOLUTION_BORDER, file=file)
+
+
+def _quantityArg(text) -> tuple[str, float]:
+    # "item=quantity", item names can have anything but the last = in them
+    import argparse
+    item, sep, quantity = text.rpartition('=')
+    try:
+        if sep == '' or item == '':
+            raise ValueError
+        return item, float(quantity)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected NAME=NUMBER, got {text!r}')
+
+
+def _readIntents(path):
+    # One JSON intent per line, read as they come so a pipeline can feed queries one at a time
+    import json
+    import sys
+    f = sys.stdin if path == '-' else open(path)
+    try:
+        for line in f:
+            if line.strip() != '':
+                yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
 
 if __name__ == '__main__':
-    solve(HAVE, INTENT, COST)
\ No newline at end of file
+    # python solver.py                                  -> INTENT with HAVE and COST as set above
+    # python solver.py "legal document=2" --format json -> any intent, machine-readable
+    # python solver.py --intents - --format csv < intents.jsonl
+    import argparse
+
+    from output import OUTPUT_FORMATS, SolutionWriter
+
+    parser = argparse.ArgumentParser(description='Find the fewest actions to get some items')
+    parser.add_argument('intent', nargs='*', type=_quantityArg, metavar='ITEM=QUANTITY', help='Defaults to INTENT')
+    parser.add_argument('--intents', metavar='FILE', help='Solve every JSON intent in FILE (one per line, - for stdin) instead')
+    parser.add_argument('--have', nargs='*', type=_quantityArg, metavar='ITEM=QUANTITY', help='Inventory, defaults to HAVE')
+    parser.add_argument('--cost', nargs='*', type=_quantityArg, default=[], metavar='KIND=WEIGHT', help='Overrides of COST')
+    parser.add_argument('--stats', nargs='*', type=_quantityArg, default=[], metavar='STAT=LEVEL', help='Overrides of the player stats')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='table')
+    parser.add_argument('--mode', choices=['search', 'beam', 'lp', 'table'], default='search')
+    parser.add_argument('--keep', type=int, default=SOLUTIONS_TO_KEEP)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--beam-width', type=int, default=BEAM_WIDTH)
+    parser.add_argument('--time-limit', type=float, metavar='SECONDS', help='Return the best found so far after this long')
+    parser.add_argument('--node-limit', type=int, metavar='NODES', help='Return the best found so far after expanding this many nodes')
+    parser.add_argument('--catalog', help='JSON/TOML activity file instead of the built-in catalog')
+    parser.add_argument('--cache-dir', default=RESULT_CACHE_DIR, help='Keep search results in this directory between runs')
+    parser.add_argument('--profile', default=PROFILE_OUTPUT, metavar='FILE', help='Write a JSON profile of the run here')
+    args = parser.parse_args()
+    if args.intent != [] and args.intents is not None:
+        parser.error('give an intent or --intents, not both')
+    if (args.time_limit is not None or args.node_limit is not None) and (args.mode != 'search' or (args.workers or 1) > 1):
+        parser.error('--time-limit and --node-limit only apply to the serial search')
+
+    if args.intents is not None:
+        intents = _readIntents(args.intents)
+    else:
+        intents = [dict(args.intent) if args.intent != [] else INTENT]
+    have = dict(args.have) if args.have is not None else HAVE
+    cost = {**COST, **dict(args.cost)}
+    profile = Profile() if args.profile is not None else None
+    cache = ResultCache(path=args.cache_dir)
+
+    with _phase(profile, 'tree'):
+        from game import player_stats
+        stats = {**player_stats, **dict(args.stats)}
+        if args.catalog is not None:
+            # Parsed and indexed once per file and stats profile, later runs unpickle the tree
+            from catalog import loadCatalog
+            tree = loadCatalog(args.catalog, player_stats=stats)
+        else:
+            tree = GameTree(LIST_OF_ACTIVITIES, stats)
+
+    writer = SolutionWriter(args.format, cost=cost, headings=args.intents is not None)
+    # Each query's solutions are written out before the next intent is even read,
+    # the shared cache still lets multiples of an earlier intent skip the search
+    try:
+        for query, intent in enumerate(intents):
+            solutions = solve(
+                have, intent, cost, args.mode, args.keep, tree, args.workers, args.beam_width, profile=profile, cache=cache,
+                time_limit=args.time_limit, node_limit=args.node_limit,
+            )
+            writer.writeQuery(query, intent, solutions)
+    except BrokenPipeError:
+        # Whatever was reading (e.g. head) has had enough, stop quietly
+        import os
+        import sys
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    if profile is not None:
+        with open(args.profile, 'w') as f:
+            f.write(profile.toJSON(indent=4))
@@ -0,0 +1,140 @@
+import math
+import sys
+from collections import Counter
+from dataclasses import dataclass
+
+from game import Activity, GameTree
+
+
+@dataclass
+class UnitCost:
+    item: str
+    actions: float  # Actions per unit, inputs priced recursively
+    recipe: Activity = None  # None for items nothing produces
+
+
+class UnitCostTable:
+    # Cheapest actions-per-unit of every item in a catalog
+    # Byproducts are not credited, so this prices the simple chain and not the LP optimum
+    # Given the table of the tree it was edited from, only the items the edit can affect are recomputed
+    def __init__(self, tree: GameTree, previous: 'UnitCostTable' = None, changed_items=None):
+        items = set(tree._input_index) | set(tree._output_index)
+        if previous is None:
+            self.costs: dict[str, UnitCost] = {}
+        else:
+            self.costs = {item: cost for item, cost in previous.costs.items() if item in items and item not in changed_items}
+        self._computeCosts(tree, items - self.costs.keys())
+
+    def _computeCosts(self, tree: GameTree, items: set[str]):
+        # Costs of items, every other cost already in the table is final
+        for item in items:
+            if item == 'echoes' or tree._output_index[item] == []:
+                self.costs[item] = UnitCost(item, 0)
+            else:
+                self.costs[item] = UnitCost(item, math.inf)
+
+        # Fixed-point iteration, every pass can only lower a cost
+        # A catalog without zero-cost cycles settles in at most len(items) passes
+        for _ in range(len(items) + 1):
+            changed = False
+            for item in items:
+                for activity in tree._output_index[item]:
+                    cost = (
+                        activity.actions
+                        + sum(
+                            self.costs[inp].actions * inp_quantity
+                            for inp, inp_quantity in activity.inputs.items()
+                        )
+                    ) / activity.outputs[item]
+                    if cost < self.costs[item].actions - 1e-12:
+                        self.costs[item] = UnitCost(item, cost, activity)
+                        changed = True
+            if not changed:
+                break
+
+    def price(self, intent: dict[str, float]) -> float:
+        return sum(self.costs[item].actions * quantity for item, quantity in intent.items() if item in self.costs)
+
+    def _recipeOrder(self, intent):
+        # Reverse postorder over the cheapest recipes so an item comes after everything that consumes it
+        order = []
+        visited = set()
+        for root in intent:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self._recipeInputs(root)))]
+            while len(stack) > 0:
+                item, inputs = stack[-1]
+                for inp in inputs:
+                    if inp not in visited:
+                        visited.add(inp)
+                        stack.append((inp, iter(self._recipeInputs(inp))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(item)
+        order.reverse()
+        return order
+
+    def _recipeInputs(self, item):
+        if item not in self.costs or self.costs[item].recipe is None:
+            return []
+        return list(self.costs[item].recipe.inputs)
+
+    def plan(self, intent: dict[str, float], have: dict[str, float] = None) -> list[tuple[Activity, float]]:
+        # Scale and combine the cached recipes, parents before the activities feeding them
+        # Every need is final by the time its item comes up, so stock is taken off it then
+        need = Counter(intent)
+        stock = Counter(have) if have is not None else Counter()
+        plan = []
+        for item in self._recipeOrder(intent):
+            covered = min(stock[item], need[item])
+            if covered > 0:
+                need[item] -= covered
+                stock[item] -= covered
+            if item not in self.costs or self.costs[item].recipe is None or need[item] <= 0:
+                continue
+            activity = self.costs[item].recipe
+            quantity = need[item] / activity.outputs[item]
+            plan.append((activity, quantity))
+            for inp, inp_quantity in activity.inputs.items():
+                need[inp] += inp_quantity * quantity
+        return plan
+
+    def report(self) -> list[tuple[str, float, str]]:
+        # Action value of every item in the catalog, most expensive first
+        return [
+            (cost.item, cost.actions, cost.recipe.description if cost.recipe is not None else '')
+            for cost in sorted(self.costs.values(), key=lambda x: (-x.actions, x.item))
+        ]
+
+
+_TABLE_CACHE: dict[str, UnitCostTable] = {}
+
+
+def getUnitCostTable(tree: GameTree) -> UnitCostTable:
+    # Computed once per catalog content, shared by every query against it
+    # A tree from GameTree.withActivity starts from its base tree's table when that one is already known
+    key = tree.fingerprint()
+    if key not in _TABLE_CACHE:
+        if tree._base is not None and tree._base[0] in _TABLE_CACHE:
+            base_key, changed_items = tree._base
+            _TABLE_CACHE[key] = UnitCostTable(tree, _TABLE_CACHE[base_key], changed_items)
+        else:
+            _TABLE_CACHE[key] = UnitCostTable(tree)
+    return _TABLE_CACHE[key]
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+
+    rows = getUnitCostTable(GameTree()).report()
+    if len(sys.argv) > 1:
+        import csv
+        with open(sys.argv[1], 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['item', 'actions per unit', 'recipe'])
+            writer.writerows(rows)
+    else:
+        print(tabulate(rows, headers=['Item', 'Actions per unit', 'Recipe'], tablefmt='fancy_grid'))